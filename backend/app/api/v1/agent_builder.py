@@ -13,6 +13,7 @@ API endpoints for Agent Builder IDE:
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
+from dataclasses import asdict
 from datetime import datetime
 
 from app.api.deps import get_current_user, ClientSupabase
@@ -308,10 +309,11 @@ async def get_test_suites(
 ):
     """Get all test suites for an agent"""
     service = get_agent_test_service(client_supabase)
-    suites = await service.get_test_suites(agent_id, include_cases=True)
+    suites = await service.get_test_suites(agent_id, include_cases=False)
+    counts = await service.count_test_cases([s.id for s in suites])
     return [TestSuiteResponse(
-        **{k: v for k, v in s.__dict__.items() if k != 'test_cases'},
-        test_cases_count=len(s.test_cases)
+        **{k: v for k, v in asdict(s).items() if k != 'test_cases'},
+        test_cases_count=counts.get(s.id, 0)
     ) for s in suites]
 
 
@@ -330,7 +332,7 @@ async def create_test_suite(
         category=data.category,
         context=data.context
     )
-    return TestSuiteResponse(**suite.__dict__, test_cases_count=0)
+    return TestSuiteResponse(**asdict(suite), test_cases_count=0)
 
 
 @router.put("/test-suites/{suite_id}", response_model=TestSuiteResponse)
@@ -348,7 +350,7 @@ async def update_test_suite(
         category=data.category,
         context=data.context
     )
-    return TestSuiteResponse(**suite.__dict__, test_cases_count=0)
+    return TestSuiteResponse(**asdict(suite), test_cases_count=0)
 
 
 @router.delete("/test-suites/{suite_id}")
@@ -374,7 +376,7 @@ async def get_test_cases(
     """Get all test cases in a suite"""
     service = get_agent_test_service(client_supabase)
     cases = await service.get_test_cases(suite_id)
-    return [TestCaseResponse(**c.__dict__) for c in cases]
+    return [TestCaseResponse(**asdict(c)) for c in cases]
 
 
 @router.post("/test-suites/{suite_id}/cases", response_model=TestCaseResponse)
@@ -394,7 +396,7 @@ async def create_test_case(
         expected_tone=data.expected_tone,
         context=data.context
     )
-    return TestCaseResponse(**case.__dict__)
+    return TestCaseResponse(**asdict(case))
 
 
 @router.put("/test-cases/{case_id}", response_model=TestCaseResponse)
@@ -414,7 +416,7 @@ async def update_test_case(
         expected_tone=data.expected_tone,
         context=data.context
     )
-    return TestCaseResponse(**case.__dict__)
+    return TestCaseResponse(**asdict(case))
 
 
 # ===========================================
@@ -453,7 +455,7 @@ async def run_all_tests(
             expected_response=r.expected_response,
             actual_response=r.actual_response,
             tools_called=r.tools_called,
-            execution_steps=[ExecutionStepResponse(**s.__dict__) for s in r.execution_steps],
+            execution_steps=[ExecutionStepResponse(**s) for s in r.execution_steps],
             duration_ms=r.duration_ms,
             error_message=r.error_message
         ) for r in run.results]
@@ -205,6 +205,9 @@ async def update_agent(
             detail="Agent not found"
         )
     
+    from app.services.ai_orchestrator import get_ai_orchestrator
+    get_ai_orchestrator().invalidate_agent(str(agent_id))
+    
     logger.info("Agent updated", agent_id=str(agent_id))
     return agent
 
@@ -248,6 +251,9 @@ async def delete_agent(
             detail="Failed to delete agent"
         )
     
+    from app.services.ai_orchestrator import get_ai_orchestrator
+    get_ai_orchestrator().invalidate_agent(str(agent_id))
+    
     logger.info("Agent deleted", agent_id=str(agent_id))
 
 
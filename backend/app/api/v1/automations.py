@@ -8,6 +8,7 @@ from fastapi import APIRouter, HTTPException, Depends, Query
 from pydantic import BaseModel
 
 from app.api.deps import get_current_tenant_id, get_tenant_supabase_client
+from app.services.deal_manager import DealManager
 
 router = APIRouter(prefix="/automations", tags=["CRM Automations"])
 
@@ -121,6 +122,8 @@ async def create_automation(
     if not result.data:
         raise HTTPException(status_code=500, detail="Failed to create automation")
     
+    DealManager.invalidate_journeys(tenant_id)
+    
     return result.data[0]
 
 
@@ -157,6 +160,8 @@ async def update_automation(
     if not result.data:
         raise HTTPException(status_code=404, detail="Automation not found")
     
+    DealManager.invalidate_journeys(tenant_id)
+    
     return result.data[0]
 
 
@@ -220,6 +225,7 @@ async def delete_automation(
     
     # Delete automation
     supabase.table("automation_journeys").delete().eq("id", automation_id).execute()
+    DealManager.invalidate_journeys(tenant_id)
     
     return {"success": True, "message": "Automation deleted"}
 
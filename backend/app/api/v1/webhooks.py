@@ -13,6 +13,7 @@ Implements:
 from typing import Optional
 from fastapi import APIRouter, Request, HTTPException, Header, Query, BackgroundTasks
 from pydantic import BaseModel
+import orjson
 import structlog
 
 from app.db.supabase import fetch_one
@@ -70,7 +71,7 @@ async def receive_webhook(
     """
     # Get raw payload
     try:
-        payload = await request.json()
+        payload = orjson.loads(await request.body())
     except Exception as e:
         logger.warning("Invalid JSON payload", error=str(e))
         raise HTTPException(status_code=400, detail="Invalid JSON payload")
@@ -104,6 +104,9 @@ class Settings(BaseSettings):
     rag_chunk_overlap: int = 200
     rag_top_k: int = 5
 
+    # Agent Test Runner
+    test_concurrency: int = 5  # Max test cases in flight against OpenAI
+
     # ===========================================
     # Rate Limiting
     # ===========================================
@@ -4,15 +4,21 @@ Apollo A.I. Advanced - Database Helpers
 Provides Supabase client utilities for tenant-specific connections.
 """
 
+from functools import lru_cache
+
 from supabase import create_client, Client
 import structlog
 
 logger = structlog.get_logger()
 
 
+@lru_cache(maxsize=256)
 def get_tenant_supabase(supabase_url: str, supabase_key: str) -> Client:
     """
-    Create a Supabase client for a specific tenant.
+    Get the Supabase client for a specific tenant.
+    
+    Clients are cached per (url, key), so services constructed per request
+    or per job reuse the same client and its kept-alive HTTP connections.
     
     Args:
         supabase_url: The tenant's Supabase URL
@@ -144,6 +144,13 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     except Exception as e:
         logger.warning(f"Background services not available: {e}. API will run without workers.")
     
+    # Open the transcription HTTP pool so the first audio skips session setup
+    try:
+        from app.services.audio_transcription import get_transcription_service
+        await get_transcription_service().warm()
+    except Exception as e:
+        logger.warning(f"Transcription service not warmed: {e}")
+    
     yield
     
     # Shutdown
@@ -157,6 +164,12 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         logger.info("Background workers stopped")
     except Exception as e:
         logger.warning(f"Error stopping workers: {e}")
+    
+    try:
+        from app.services.audio_transcription import get_transcription_service
+        await get_transcription_service().close()
+    except Exception as e:
+        logger.warning(f"Error closing transcription service: {e}")
 
 
 # ===========================================
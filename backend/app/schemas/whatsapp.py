@@ -5,7 +5,7 @@ Defensive Pydantic models for webhook payload validation
 
 from typing import Optional, List, Literal, Any
 from datetime import datetime
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from uuid import UUID
 import re
 
@@ -238,6 +238,7 @@ class MetaCloudWebhookPayload(BaseModel):
     def to_standard_messages(self) -> List[StandardMessage]:
         """Convert Meta Cloud payload to list of StandardMessages"""
         messages = []
+        raw_payload = None  # Dumped once, shared by every message in the payload
         
         for entry in self.entry:
             for change in entry.changes:
@@ -245,6 +246,8 @@ class MetaCloudWebhookPayload(BaseModel):
                     continue
                     
                 contacts = {c.wa_id: c for c in (change.value.contacts or [])}
+                if raw_payload is None:
+                    raw_payload = self.model_dump()
                 
                 for msg in change.value.messages:
                     content = ""
@@ -272,7 +275,7 @@ class MetaCloudWebhookPayload(BaseModel):
                         content_type=content_type,
                         media_url=media_url,
                         is_from_me=False,
-                        raw_payload=self.model_dump()
+                        raw_payload=raw_payload
                     ))
         
         return messages
@@ -297,8 +300,7 @@ class UAZAPIMessage(BaseModel):
     document_url: Optional[str] = Field(None, alias="documentUrl")
     timestamp: Optional[int] = None
     
-    class Config:
-        populate_by_name = True
+    model_config = ConfigDict(populate_by_name=True)
 
 
 class UAZAPIWebhookPayload(BaseModel):
@@ -338,8 +340,7 @@ class UAZAPIWebhookPayload(BaseModel):
     timestamp: Optional[int] = None
     momment: Optional[str] = None
     
-    class Config:
-        populate_by_name = True
+    model_config = ConfigDict(populate_by_name=True)
     
     def to_standard_message(self) -> Optional[StandardMessage]:
         """Convert UAZAPI payload to StandardMessage"""
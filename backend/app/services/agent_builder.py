@@ -130,6 +130,9 @@ class AgentBuilderService:
             "system_prompt": prompt
         }).eq("id", agent_id).execute()
         
+        from app.services.ai_orchestrator import get_ai_orchestrator
+        get_ai_orchestrator().invalidate_agent(agent_id)
+        
         logger.info(
             "Prompt version saved",
             agent_id=agent_id,
@@ -10,16 +10,118 @@ QA automation service for AI agents:
 """
 
 import asyncio
-from typing import Optional, List, Dict, Any
-from dataclasses import dataclass, field
+import hashlib
+import math
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+from typing import Optional, List, Dict, Any, Callable, Sequence, Tuple
+from dataclasses import dataclass, field, fields
 from datetime import datetime
 from enum import Enum
+from operator import mul
 import structlog
+from tenacity import (
+    RetryCallState,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 
 from app.core.config import settings
 
 logger = structlog.get_logger()
 
+# OpenAI accepts up to 2048 inputs per embeddings request
+EMBEDDING_BATCH_SIZE = 2048
+
+# Process-wide LRU of embeddings keyed by content hash (shared across runs).
+# Vectors are stored L2-normalized as float32 arrays: cosine scores only need
+# ~3 significant digits, and 4-byte floats use a fraction of the memory of
+# Python float lists.
+EMBEDDING_CACHE_MAX_SIZE = 10_000
+_embedding_cache: OrderedDict[str, array] = OrderedDict()
+
+
+def _embedding_key(text: str) -> str:
+    """Cache key for a text's embedding"""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _execution_step(
+    step_type: str,  # "thought", "tool_call", "guardrail", "response"
+    name: str,
+    success: bool,
+    duration_ms: int,
+    details: Dict,
+    test_mode: bool = True
+) -> Dict:
+    """
+    Build an execution step in its stored shape.
+    
+    Steps are plain dicts so the same list goes into the results insert and
+    the returned TestResult without conversion.
+    """
+    return {
+        "step_type": step_type,
+        "name": name,
+        "success": success,
+        "duration_ms": duration_ms,
+        "details": details,
+        "test_mode": test_mode
+    }
+
+
+def _is_retryable_openai_error(exc: BaseException) -> bool:
+    """Rate limits, timeouts/connection drops and 5xx are worth retrying"""
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+    return isinstance(exc, (RateLimitError, APIConnectionError, InternalServerError))
+
+
+_backoff = wait_exponential_jitter(initial=1, max=30)
+
+
+def _wait_for_openai_retry(retry_state: RetryCallState) -> float:
+    """Honor the server's Retry-After header, else back off exponentially"""
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    response = getattr(exc, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after")), 30.0)
+        except (TypeError, ValueError):
+            pass
+    return _backoff(retry_state)
+
+
+_openai_retry = retry(
+    retry=retry_if_exception(_is_retryable_openai_error),
+    wait=_wait_for_openai_retry,
+    stop=stop_after_attempt(5),
+    reraise=True
+)
+
+
+def _unit_vector(values: Sequence[float]) -> array:
+    """
+    L2-normalize an embedding into a float32 array.
+    
+    Cached vectors are stored normalized, so cosine similarity between two
+    of them is a single dot product with no norm computations.
+    """
+    magnitude = math.sqrt(sum(map(mul, values, values))) or 1.0
+    return array("f", [v / magnitude for v in values])
+
+
+def _cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    """
+    Cosine similarity of two unit vectors (see _unit_vector).
+    
+    The reduction runs through map(operator.mul) so the per-element loop
+    stays in C instead of a Python-level generator.
+    """
+    return sum(map(mul, a, b))
+
 
 class TestStatus(str, Enum):
     PENDING = "pending"
@@ -29,7 +131,7 @@ class TestStatus(str, Enum):
     ERROR = "error"
 
 
-@dataclass
+@dataclass(slots=True)
 class TestCase:
     id: str
     suite_id: str
@@ -43,7 +145,7 @@ class TestCase:
     order_index: int
 
 
-@dataclass
+@dataclass(slots=True)
 class TestSuite:
     id: str
     agent_id: str
@@ -57,17 +159,18 @@ class TestSuite:
     test_cases: List[TestCase] = field(default_factory=list)
 
 
-@dataclass
-class ExecutionStep:
-    step_type: str  # "thought", "tool_call", "guardrail", "response"
-    name: str
-    success: bool
+@dataclass(slots=True)
+class TestGeneration:
+    """Output of running a test case's conversation, before scoring"""
+    user_input: str
+    expected_response: str
+    actual_response: str
+    tools_called: List[Dict]
+    execution_steps: List[Dict]
     duration_ms: int
-    details: Dict
-    test_mode: bool = True
 
 
-@dataclass
+@dataclass(slots=True)
 class TestResult:
     id: str
     case_id: str
@@ -77,12 +180,12 @@ class TestResult:
     expected_response: Optional[str]
     actual_response: str
     tools_called: List[Dict]
-    execution_steps: List[ExecutionStep]
+    execution_steps: List[Dict]
     duration_ms: int
     error_message: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class TestRun:
     id: str
     agent_id: str
@@ -97,6 +200,12 @@ class TestRun:
     results: List[TestResult] = field(default_factory=list)
 
 
+# Column projections matching the dataclasses, so listings never pull
+# unused columns (timestamps, last scores) over the wire
+TEST_CASE_COLUMNS = ", ".join(f.name for f in fields(TestCase))
+TEST_SUITE_COLUMNS = ", ".join(f.name for f in fields(TestSuite) if f.name != "test_cases")
+
+
 class AgentTestService:
     """
     Test Runner - QA automation for AI agents
@@ -111,7 +220,16 @@ class AgentTestService:
     def __init__(self, supabase):
         self.supabase = supabase
         self._openai_client = None
-        self._embedding_cache = {}
+        self._embedding_cache = _embedding_cache
+    
+    async def _db(self, query: Callable[[], Any]) -> Any:
+        """
+        Run a blocking Supabase call in a worker thread.
+        
+        The supabase-py client is synchronous; running it off the event loop
+        keeps concurrent test cases (and their OpenAI calls) moving.
+        """
+        return await asyncio.to_thread(query)
     
     @property
     def openai(self):
@@ -121,6 +239,19 @@ class AgentTestService:
             self._openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         return self._openai_client
     
+    @_openai_retry
+    async def _chat(self, **kwargs) -> Any:
+        """Chat completion with retry on transient OpenAI errors"""
+        return await self.openai.chat.completions.create(**kwargs)
+    
+    @_openai_retry
+    async def _embed(self, texts: List[str]) -> Any:
+        """Embeddings request with retry on transient OpenAI errors"""
+        return await self.openai.embeddings.create(
+            model="text-embedding-3-small",
+            input=texts
+        )
+    
     # ===========================================
     # TEST SUITE MANAGEMENT
     # ===========================================
@@ -135,13 +266,13 @@ class AgentTestService:
     ) -> TestSuite:
         """Create a new test suite for an agent"""
         
-        result = self.supabase.table("agent_test_suites").insert({
+        result = await self._db(lambda: self.supabase.table("agent_test_suites").insert({
             "agent_id": agent_id,
             "name": name,
             "description": description,
             "category": category,
             "context": context or {}
-        }).execute()
+        }).execute())
         
         if not result.data:
             raise Exception("Failed to create test suite")
@@ -155,19 +286,24 @@ class AgentTestService:
     ) -> List[TestSuite]:
         """Get all test suites for an agent"""
         
-        result = self.supabase.table("agent_test_suites").select("*").eq(
+        result = await self._db(lambda: self.supabase.table("agent_test_suites").select(TEST_SUITE_COLUMNS).eq(
             "agent_id", agent_id
-        ).order("created_at").execute()
+        ).order("created_at").execute())
+        
+        suites = [TestSuite(**suite_data, test_cases=[]) for suite_data in (result.data or [])]
         
-        suites = []
-        for suite_data in (result.data or []):
-            suite = TestSuite(**suite_data, test_cases=[])
+        if include_cases and suites:
+            # Fetch every suite's cases in one query instead of one per suite
+            cases = await self._db(lambda: self.supabase.table("agent_test_cases").select(TEST_CASE_COLUMNS).in_(
+                "suite_id", [suite.id for suite in suites]
+            ).eq("is_active", True).order("order_index").execute())
             
-            if include_cases:
-                cases = await self.get_test_cases(suite.id)
-                suite.test_cases = cases
+            cases_by_suite = defaultdict(list)
+            for case_data in (cases.data or []):
+                cases_by_suite[case_data["suite_id"]].append(TestCase(**case_data))
             
-            suites.append(suite)
+            for suite in suites:
+                suite.test_cases = cases_by_suite[suite.id]
         
         return suites
     
@@ -180,9 +316,9 @@ class AgentTestService:
         
         updates["updated_at"] = datetime.utcnow().isoformat()
         
-        result = self.supabase.table("agent_test_suites").update(
+        result = await self._db(lambda: self.supabase.table("agent_test_suites").update(
             updates
-        ).eq("id", suite_id).execute()
+        ).eq("id", suite_id).execute())
         
         if not result.data:
             raise Exception("Failed to update test suite")
@@ -191,7 +327,7 @@ class AgentTestService:
     
     async def delete_test_suite(self, suite_id: str) -> bool:
         """Delete a test suite and all its cases"""
-        self.supabase.table("agent_test_suites").delete().eq("id", suite_id).execute()
+        await self._db(lambda: self.supabase.table("agent_test_suites").delete().eq("id", suite_id).execute())
         return True
     
     # ===========================================
@@ -211,13 +347,13 @@ class AgentTestService:
         """Create a test case in a suite"""
         
         # Get max order index
-        existing = self.supabase.table("agent_test_cases").select("order_index").eq(
+        existing = await self._db(lambda: self.supabase.table("agent_test_cases").select("order_index").eq(
             "suite_id", suite_id
-        ).order("order_index", desc=True).limit(1).execute()
+        ).order("order_index", desc=True).limit(1).execute())
         
         next_index = (existing.data[0]["order_index"] + 1) if existing.data else 0
         
-        result = self.supabase.table("agent_test_cases").insert({
+        result = await self._db(lambda: self.supabase.table("agent_test_cases").insert({
             "suite_id": suite_id,
             "name": name,
             "description": description,
@@ -226,7 +362,7 @@ class AgentTestService:
             "expected_tone": expected_tone,
             "context": context or {},
             "order_index": next_index
-        }).execute()
+        }).execute())
         
         if not result.data:
             raise Exception("Failed to create test case")
@@ -236,12 +372,28 @@ class AgentTestService:
     async def get_test_cases(self, suite_id: str) -> List[TestCase]:
         """Get all test cases in a suite"""
         
-        result = self.supabase.table("agent_test_cases").select("*").eq(
+        result = await self._db(lambda: self.supabase.table("agent_test_cases").select(TEST_CASE_COLUMNS).eq(
             "suite_id", suite_id
-        ).eq("is_active", True).order("order_index").execute()
+        ).eq("is_active", True).order("order_index").execute())
         
         return [TestCase(**c) for c in (result.data or [])]
     
+    async def count_test_cases(self, suite_ids: List[str]) -> Dict[str, int]:
+        """Count active test cases per suite without loading their messages"""
+        
+        if not suite_ids:
+            return {}
+        
+        result = await self._db(lambda: self.supabase.table("agent_test_cases").select(
+            "suite_id"
+        ).in_("suite_id", suite_ids).eq("is_active", True).execute())
+        
+        counts = defaultdict(int)
+        for row in (result.data or []):
+            counts[row["suite_id"]] += 1
+        
+        return dict(counts)
+    
     async def update_test_case(
         self,
         case_id: str,
@@ -251,9 +403,9 @@ class AgentTestService:
         
         updates["updated_at"] = datetime.utcnow().isoformat()
         
-        result = self.supabase.table("agent_test_cases").update(
+        result = await self._db(lambda: self.supabase.table("agent_test_cases").update(
             updates
-        ).eq("id", case_id).execute()
+        ).eq("id", case_id).execute())
         
         if not result.data:
             raise Exception("Failed to update test case")
@@ -277,55 +429,54 @@ class AgentTestService:
         
         # Create test run
         total_cases = sum(len(s.test_cases) for s in active_suites)
+        start = time.perf_counter()
         
-        run_result = self.supabase.table("agent_test_runs").insert({
+        run_result = await self._db(lambda: self.supabase.table("agent_test_runs").insert({
             "agent_id": agent_id,
             "status": "running",
             "total_tests": total_cases,
             "triggered_by": triggered_by,
             "started_at": datetime.utcnow().isoformat()
-        }).execute()
+        }).execute())
         
         run_id = run_result.data[0]["id"]
         
-        # Run all tests
-        all_results = []
-        passed = 0
-        failed = 0
+        # Agent config is invariant across the run, fetch it once
+        agent = await self._get_agent_config(agent_id)
         
-        for suite in active_suites:
-            for case in suite.test_cases:
-                try:
-                    result = await self._execute_test_case(
-                        run_id=run_id,
-                        agent_id=agent_id,
-                        case=case,
-                        suite_context=suite.context
-                    )
-                    all_results.append(result)
-                    
-                    if result.status == TestStatus.PASSED:
-                        passed += 1
-                    else:
-                        failed += 1
-                        
-                except Exception as e:
-                    logger.error("Test case failed", case_id=case.id, error=str(e))
-                    failed += 1
+        # Run suites concurrently; the shared semaphore caps total cases in flight
+        semaphore = asyncio.Semaphore(max(1, settings.test_concurrency))
+        
+        async with asyncio.TaskGroup() as tg:
+            tasks = [
+                tg.create_task(self._execute_test_cases(
+                    run_id=run_id,
+                    agent=agent,
+                    cases=[(case, suite.context) for case in suite.test_cases],
+                    semaphore=semaphore
+                ))
+                for suite in active_suites
+            ]
+        
+        all_results = [result for task in tasks for result in task.result()]
+        passed = sum(1 for r in all_results if r.status == TestStatus.PASSED)
+        failed = total_cases - passed
         
         # Calculate average score
         avg_score = sum(r.score for r in all_results) / len(all_results) if all_results else 0
         
         # Update run status
         final_status = "passed" if failed == 0 else "failed"
+        duration_ms = int((time.perf_counter() - start) * 1000)
         
-        self.supabase.table("agent_test_runs").update({
+        await self._db(lambda: self.supabase.table("agent_test_runs").update({
             "status": final_status,
             "passed_tests": passed,
             "failed_tests": failed,
             "average_score": avg_score,
+            "duration_ms": duration_ms,
             "completed_at": datetime.utcnow().isoformat()
-        }).eq("id", run_id).execute()
+        }).eq("id", run_id).execute())
         
         return TestRun(
             id=run_id,
@@ -336,7 +487,7 @@ class AgentTestService:
             passed_tests=passed,
             failed_tests=failed,
             average_score=avg_score,
-            duration_ms=0,
+            duration_ms=duration_ms,
             triggered_by=triggered_by,
             results=all_results
         )
@@ -349,59 +500,58 @@ class AgentTestService:
         """Run all tests in a specific suite"""
         
         # Get suite with cases
-        suite_result = self.supabase.table("agent_test_suites").select("*").eq(
+        suite_result = await self._db(lambda: self.supabase.table("agent_test_suites").select("agent_id, context").eq(
             "id", suite_id
-        ).single().execute()
+        ).single().execute())
         
         if not suite_result.data:
             raise Exception("Suite not found")
         
         suite_data = suite_result.data
         cases = await self.get_test_cases(suite_id)
+        start = time.perf_counter()
         
         # Create run
-        run_result = self.supabase.table("agent_test_runs").insert({
+        run_result = await self._db(lambda: self.supabase.table("agent_test_runs").insert({
             "agent_id": suite_data["agent_id"],
             "suite_id": suite_id,
             "status": "running",
             "total_tests": len(cases),
             "triggered_by": triggered_by,
             "started_at": datetime.utcnow().isoformat()
-        }).execute()
+        }).execute())
         
         run_id = run_result.data[0]["id"]
         
         # Execute tests
-        results = []
-        passed = 0
-        
-        for case in cases:
-            result = await self._execute_test_case(
-                run_id=run_id,
-                agent_id=suite_data["agent_id"],
-                case=case,
-                suite_context=suite_data.get("context", {})
-            )
-            results.append(result)
-            if result.status == TestStatus.PASSED:
-                passed += 1
+        agent = await self._get_agent_config(suite_data["agent_id"])
+        suite_context = suite_data.get("context", {})
+        results = await self._execute_test_cases(
+            run_id=run_id,
+            agent=agent,
+            cases=[(case, suite_context) for case in cases]
+        )
+        passed = sum(1 for r in results if r.status == TestStatus.PASSED)
         
         # Finalize
         avg_score = sum(r.score for r in results) / len(results) if results else 0
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        now = datetime.utcnow().isoformat()
         
-        self.supabase.table("agent_test_runs").update({
+        await self._db(lambda: self.supabase.table("agent_test_runs").update({
             "status": "passed" if passed == len(cases) else "failed",
             "passed_tests": passed,
             "failed_tests": len(cases) - passed,
             "average_score": avg_score,
-            "completed_at": datetime.utcnow().isoformat()
-        }).eq("id", run_id).execute()
+            "duration_ms": duration_ms,
+            "completed_at": now
+        }).eq("id", run_id).execute())
         
         # Update suite pass rate
-        self.supabase.table("agent_test_suites").update({
+        await self._db(lambda: self.supabase.table("agent_test_suites").update({
             "pass_rate": avg_score,
-            "last_run_at": datetime.utcnow().isoformat()
-        }).eq("id", suite_id).execute()
+            "last_run_at": now
+        }).eq("id", suite_id).execute())
         
         return TestRun(
             id=run_id,
@@ -412,34 +562,115 @@ class AgentTestService:
             passed_tests=passed,
             failed_tests=len(cases) - passed,
             average_score=avg_score,
-            duration_ms=0,
+            duration_ms=duration_ms,
             triggered_by=triggered_by,
             results=results
         )
     
-    async def _execute_test_case(
+    async def _execute_test_cases(
         self,
         run_id: str,
-        agent_id: str,
+        agent: Dict,
+        cases: List[Tuple[TestCase, Dict]],
+        semaphore: Optional[asyncio.Semaphore] = None
+    ) -> List[TestResult]:
+        """
+        Execute test cases concurrently, bounded by settings.test_concurrency.
+        
+        Cases are I/O-bound on OpenAI, so overlapping them cuts wall-clock
+        time while the semaphore keeps us under the account's rate limits.
+        Pass a shared semaphore to cap concurrency across several calls.
+        
+        Generation and scoring are pipelined: finished generations are queued
+        and a scorer drains everything waiting into one batched embeddings
+        request while the remaining cases are still generating. Cases that
+        raise are logged and left out of the results (they count as failures
+        for the run).
+        """
+        
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(max(1, settings.test_concurrency))
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        scored: List[Tuple[int, TestCase, TestGeneration, float]] = []
+        
+        async def _generate(index: int, case: TestCase, suite_context: Dict) -> None:
+            try:
+                async with semaphore:
+                    generation = await self._generate_test_case(
+                        agent=agent,
+                        case=case,
+                        suite_context=suite_context
+                    )
+            except Exception as e:
+                logger.error("Test case failed", case_id=case.id, error=str(e))
+                return
+            await queue.put((index, case, generation))
+        
+        async def _produce() -> None:
+            try:
+                await asyncio.gather(*[
+                    _generate(index, case, suite_context)
+                    for index, (case, suite_context) in enumerate(cases)
+                ])
+            finally:
+                await queue.put(None)  # All generations queued
+        
+        async def _score() -> None:
+            finished = False
+            while not finished:
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                if batch[-1] is None:
+                    finished = True
+                    batch.pop()
+                if not batch:
+                    continue
+                
+                scores = await self._calculate_semantic_scores([
+                    (generation.expected_response, generation.actual_response)
+                    for _, _, generation in batch
+                ])
+                scored.extend(
+                    (index, case, generation, score)
+                    for (index, case, generation), score in zip(batch, scores, strict=True)
+                )
+        
+        await asyncio.gather(_produce(), _score())
+        
+        # Keep results in case order regardless of completion order
+        scored.sort(key=lambda item: item[0])
+        
+        return await self._save_test_results(
+            run_id=run_id,
+            scored=[(case, generation, score) for _, case, generation, score in scored]
+        )
+    
+    async def _get_agent_config(self, agent_id: str) -> Dict:
+        """Fetch the agent fields test generation needs"""
+        
+        agent_result = await self._db(lambda: self.supabase.table("agents").select(
+            "model_name, system_prompt, temperature"
+        ).eq("id", agent_id).single().execute())
+        
+        return agent_result.data
+    
+    async def _generate_test_case(
+        self,
+        agent: Dict,
         case: TestCase,
         suite_context: Dict
-    ) -> TestResult:
-        """Execute a single test case"""
+    ) -> TestGeneration:
+        """Run a test case's conversation against the agent (no scoring)"""
         
-        start_time = datetime.utcnow()
+        start = time.perf_counter()
         execution_steps = []
         tools_called = []
         
         # Merge contexts
         context = {**suite_context, **case.context}
         
-        # Get agent config
-        agent_result = self.supabase.table("agents").select("*").eq(
-            "id", agent_id
-        ).single().execute()
-        
-        agent = agent_result.data
-        
         # Process each message in the test
         final_response = ""
         user_input = ""
@@ -451,7 +682,7 @@ class AgentTestService:
                 expected_response = msg.get("expected_response", "")
                 
                 # Simulate AI response
-                execution_steps.append(ExecutionStep(
+                execution_steps.append(_execution_step(
                     step_type="thought",
                     name="Analyzing message",
                     success=True,
@@ -461,7 +692,7 @@ class AgentTestService:
                 
                 # Call AI (in test mode)
                 try:
-                    response = await self.openai.chat.completions.create(
+                    response = await self._chat(
                         model=agent.get("model_name", "gpt-4o-mini"),
                         messages=[
                             {"role": "system", "content": agent.get("system_prompt", "")},
@@ -473,7 +704,7 @@ class AgentTestService:
                     
                     final_response = response.choices[0].message.content.strip()
                     
-                    execution_steps.append(ExecutionStep(
+                    execution_steps.append(_execution_step(
                         step_type="response",
                         name="Generated response",
                         success=True,
@@ -482,7 +713,7 @@ class AgentTestService:
                     ))
                     
                 except Exception as e:
-                    execution_steps.append(ExecutionStep(
+                    execution_steps.append(_execution_step(
                         step_type="error",
                         name="AI Generation Failed",
                         success=False,
@@ -491,52 +722,9 @@ class AgentTestService:
                     ))
                     raise
         
-        # Calculate score
-        score = await self._calculate_semantic_score(
-            expected=expected_response,
-            actual=final_response
-        )
+        duration_ms = int((time.perf_counter() - start) * 1000)
         
-        # Determine status
-        status = TestStatus.PASSED if score >= 70 else TestStatus.FAILED
-        
-        duration_ms = int((datetime.utcnow() - start_time).total_seconds() * 1000)
-        
-        # Save result
-        result_data = self.supabase.table("agent_test_results").insert({
-            "run_id": run_id,
-            "case_id": case.id,
-            "status": status.value,
-            "score": score,
-            "user_input": user_input,
-            "expected_response": expected_response,
-            "actual_response": final_response,
-            "tools_called": tools_called,
-            "execution_steps": [
-                {
-                    "step_type": s.step_type,
-                    "name": s.name,
-                    "success": s.success,
-                    "duration_ms": s.duration_ms,
-                    "details": s.details,
-                    "test_mode": s.test_mode
-                }
-                for s in execution_steps
-            ],
-            "duration_ms": duration_ms
-        }).execute()
-        
-        # Update case last score
-        self.supabase.table("agent_test_cases").update({
-            "last_score": score,
-            "last_run_at": datetime.utcnow().isoformat()
-        }).eq("id", case.id).execute()
-        
-        return TestResult(
-            id=result_data.data[0]["id"],
-            case_id=case.id,
-            status=status,
-            score=score,
+        return TestGeneration(
             user_input=user_input,
             expected_response=expected_response,
             actual_response=final_response,
@@ -545,49 +733,178 @@ class AgentTestService:
             duration_ms=duration_ms
         )
     
-    # ===========================================
-    # SCORING
-    # ===========================================
-    
-    async def _calculate_semantic_score(
+    async def _save_test_results(
         self,
-        expected: str,
-        actual: str
-    ) -> float:
-        """Calculate semantic similarity score using embeddings"""
+        run_id: str,
+        scored: List[Tuple[TestCase, TestGeneration, float]]
+    ) -> List[TestResult]:
+        """
+        Persist scored test cases and update their last scores.
         
-        if not expected:
-            return 85.0  # No expected response = pass if no errors
+        Results go out as one bulk insert and case scores as one bulk upsert,
+        instead of two writes per case.
+        """
         
-        if not actual:
-            return 0.0
+        if not scored:
+            return []
         
-        try:
-            # Get embeddings
-            response = await self.openai.embeddings.create(
-                model="text-embedding-3-small",
-                input=[expected, actual]
-            )
-            
-            embed_expected = response.data[0].embedding
-            embed_actual = response.data[1].embedding
-            
-            # Cosine similarity
-            dot_product = sum(a * b for a, b in zip(embed_expected, embed_actual))
-            magnitude_a = sum(a ** 2 for a in embed_expected) ** 0.5
-            magnitude_b = sum(b ** 2 for b in embed_actual) ** 0.5
-            
-            similarity = dot_product / (magnitude_a * magnitude_b)
+        now = datetime.utcnow().isoformat()
+        result_rows = []
+        case_updates = []
+        results = []
+        
+        for case, generation, score in scored:
+            # Determine status
+            status = TestStatus.PASSED if score >= 70 else TestStatus.FAILED
             
-            # Convert to 0-100 score
-            score = (similarity + 1) / 2 * 100
+            result_rows.append({
+                "run_id": run_id,
+                "case_id": case.id,
+                "status": status.value,
+                "score": score,
+                "user_input": generation.user_input,
+                "expected_response": generation.expected_response,
+                "actual_response": generation.actual_response,
+                "tools_called": generation.tools_called,
+                "execution_steps": generation.execution_steps,
+                "duration_ms": generation.duration_ms
+            })
             
-            return round(score, 2)
+            # suite_id/name ride along so the upsert satisfies NOT NULL columns
+            case_updates.append({
+                "id": case.id,
+                "suite_id": case.suite_id,
+                "name": case.name,
+                "last_score": score,
+                "last_run_at": now
+            })
             
+            results.append(TestResult(
+                id="",
+                case_id=case.id,
+                status=status,
+                score=score,
+                user_input=generation.user_input,
+                expected_response=generation.expected_response,
+                actual_response=generation.actual_response,
+                tools_called=generation.tools_called,
+                execution_steps=generation.execution_steps,
+                duration_ms=generation.duration_ms
+            ))
+        
+        # Save results
+        result_data = await self._db(lambda: self.supabase.table("agent_test_results").insert(
+            result_rows
+        ).execute())
+        
+        # Update cases' last score
+        await self._db(lambda: self.supabase.table("agent_test_cases").upsert(
+            case_updates,
+            on_conflict="id"
+        ).execute())
+        
+        # Inserted rows come back in request order; a short response raises
+        # instead of leaving results without ids
+        for result, row in zip(results, result_data.data or [], strict=True):
+            result.id = row["id"]
+        
+        return results
+    
+    # ===========================================
+    # SCORING
+    # ===========================================
+    
+    async def _calculate_semantic_scores(
+        self,
+        pairs: List[Tuple[str, str]]
+    ) -> List[float]:
+        """
+        Score many (expected, actual) pairs with batched embedding requests.
+        
+        All texts that need an embedding are sent in as few calls as the
+        endpoint allows (EMBEDDING_BATCH_SIZE inputs each) instead of one
+        call per pair.
+        """
+        
+        scores: List[Optional[float]] = []
+        texts: List[str] = []
+        
+        for expected, actual in pairs:
+            if not expected:
+                scores.append(85.0)  # No expected response = pass if no errors
+            elif not actual:
+                scores.append(0.0)
+            elif expected == actual or expected.split() == actual.split():
+                scores.append(100.0)  # Identical up to whitespace, no embedding needed
+            else:
+                scores.append(None)
+                texts.extend((expected, actual))
+        
+        if not texts:
+            return scores
+        
+        try:
+            embeddings = await self._get_embeddings(texts)
         except Exception as e:
             logger.error("Embedding calculation failed", error=str(e))
             # Fallback to simple matching
-            return 50.0 if actual else 0.0
+            return [50.0 if score is None else score for score in scores]
+        
+        pending = iter(zip(embeddings[0::2], embeddings[1::2], strict=True))
+        return [
+            self._similarity_to_score(*next(pending)) if score is None else score
+            for score in scores
+        ]
+    
+    async def _get_embeddings(self, texts: List[str]) -> List[array]:
+        """
+        Get embeddings for texts, reusing cached vectors where possible.
+        
+        Vectors are memoized by content hash, so stable expected responses
+        are only embedded once per process. Misses are deduplicated and
+        fetched in EMBEDDING_BATCH_SIZE chunks.
+        """
+        
+        cache = self._embedding_cache
+        keys = [_embedding_key(text) for text in texts]
+        
+        resolved: Dict[str, array] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts, strict=True):
+            if key in cache:
+                cache.move_to_end(key)
+                resolved[key] = cache[key]
+            else:
+                missing.setdefault(key, text)
+        
+        if missing:
+            missing_keys = list(missing)
+            for start in range(0, len(missing_keys), EMBEDDING_BATCH_SIZE):
+                batch = missing_keys[start:start + EMBEDDING_BATCH_SIZE]
+                response = await self._embed([missing[key] for key in batch])
+                for key, item in zip(batch, response.data, strict=True):
+                    resolved[key] = cache[key] = _unit_vector(item.embedding)
+        
+        embeddings = [resolved[key] for key in keys]
+        
+        # Evict least recently used vectors beyond the cap
+        while len(cache) > EMBEDDING_CACHE_MAX_SIZE:
+            cache.popitem(last=False)
+        
+        logger.debug("Embeddings resolved", total=len(texts), fetched=len(missing))
+        
+        return embeddings
+    
+    @staticmethod
+    def _similarity_to_score(embed_expected: Sequence[float], embed_actual: Sequence[float]) -> float:
+        """Convert the cosine similarity of two normalized embeddings to a 0-100 score"""
+        
+        similarity = _cosine_similarity(embed_expected, embed_actual)
+        
+        # Convert to 0-100 score
+        score = (similarity + 1) / 2 * 100
+        
+        return round(score, 2)
     
     # ===========================================
     # REGRESSION DETECTION
@@ -601,11 +918,11 @@ class AgentTestService:
         """Check if new score represents a regression"""
         
         # Get last 5 runs
-        runs = self.supabase.table("agent_test_runs").select(
+        runs = await self._db(lambda: self.supabase.table("agent_test_runs").select(
             "average_score, created_at"
         ).eq("agent_id", agent_id).eq("status", "passed").order(
             "created_at", desc=True
-        ).limit(5).execute()
+        ).limit(5).execute())
         
         if not runs.data or len(runs.data) < 2:
             return None
@@ -16,8 +16,13 @@ Architecture:
 - Integrates with RAG for knowledge grounding
 """
 
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from importlib.util import find_spec
+from typing import Optional, List, Dict, Any, AsyncIterator
 from enum import Enum
 import structlog
 import json
@@ -34,6 +39,19 @@ from app.core.config import settings
 
 logger = structlog.get_logger()
 
+AGENT_CACHE_TTL_SECONDS = 60  # Agent configs change on the order of minutes
+INTENT_CACHE_MAX_SIZE = 10_000  # Classified messages kept in memory (LRU)
+OPENAI_MAX_CONNECTIONS = 200
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 100
+OPENAI_TIMEOUT_SECONDS = 30.0
+HISTORY_MASK_AFTER_TURNS = 3  # Recent turns always sent verbatim
+HISTORY_MASK_MIN_CHARS = 500  # Older messages longer than this are masked
+HISTORY_MASK_EXTRACT_CHARS = 120
+HISTORY_CACHE_TTL_SECONDS = 30  # Follow-up packets reuse the previous turn's context
+HISTORY_CACHE_MAX_SIZE = 1_000
+STREAM_CHECK_INTERVAL_CHARS = 200  # New streamed text between guardrail scans
+STREAM_CHECK_OVERLAP_CHARS = 200  # Already-scanned tail rescanned for split matches
+
 
 class MessageIntent(str, Enum):
     """Detected message intents"""
@@ -47,36 +65,106 @@ class MessageIntent(str, Enum):
     UNKNOWN = "unknown"
 
 
+# Messages that are unambiguous on their own, classified without the LLM
+_LOCAL_INTENTS: Dict[str, MessageIntent] = {
+    **dict.fromkeys((
+        "oi", "olá", "ola", "oie", "opa", "eae", "e aí", "e ai", "hello", "hi",
+        "bom dia", "boa tarde", "boa noite",
+        "oi, bom dia", "oi, boa tarde", "oi, boa noite",
+        "olá, bom dia", "olá, boa tarde", "olá, boa noite",
+    ), MessageIntent.GREETING),
+    **dict.fromkeys((
+        "tchau", "tchau tchau", "até logo", "até mais", "até amanhã", "falou",
+        "obrigado, tchau", "obrigada, tchau", "valeu, tchau",
+    ), MessageIntent.FAREWELL),
+}
+_INTENT_PUNCTUATION = " !?.,;:~"
+
+AUDIO_PLACEHOLDER = "[Áudio recebido - transcrição pendente]"
+IMAGE_PLACEHOLDER = "[Imagem recebida]"
+EMPTY_MESSAGE_PLACEHOLDER = "[Mensagem sem conteúdo de texto]"
+
+# messages.sender_type -> LLM role; everything else is the customer
+_SENDER_ROLES = {"ai": "assistant", "agent": "assistant"}
+
+
+def _as_tuple(patterns: Optional[List[str]]) -> Optional[tuple]:
+    """Freeze a pattern list so it can key the compiled-pattern cache"""
+    return tuple(patterns) if patterns is not None else None
+
+
+def _render_message(msg: StandardMessage) -> Optional[str]:
+    """Render one buffered message as prompt text (None to skip it)"""
+    if msg.content_type == "text":
+        return msg.content or None
+    if msg.content_type == "audio":
+        # Audio transcription placeholder
+        return AUDIO_PLACEHOLDER
+    if msg.content_type == "image":
+        return IMAGE_PLACEHOLDER + ": " + msg.content if msg.content else IMAGE_PLACEHOLDER
+    return None
+
+
+def _mask_content(content: str) -> str:
+    """Replace a long history message with a hash pointer and a short extract"""
+    digest = hashlib.blake2b(content.encode(), digest_size=4).hexdigest()
+    extract = " ".join(content.split())[:HISTORY_MASK_EXTRACT_CHARS].rsplit(" ", 1)[0]
+    return f"[evicted:{digest} — {extract}…]"
+
+
+@dataclass(slots=True, frozen=True)
 class AgentConfig:
     """Loaded agent configuration"""
+    id: Optional[str]
+    tenant_id: Optional[str]
+    name: Optional[str]
+    model_provider: str
+    model_name: str
+    temperature: float
+    max_tokens: int
+    system_prompt: str
+    greeting_message: Optional[str]
+    fallback_message: str
+    handoff_message: str
+    memory_enabled: bool
+    memory_window: int
+    rag_enabled: bool
+    intent_router_enabled: bool
+    
+    # Guardrails (Security)
+    guardrails_enabled: bool
+    guardrails_config: GuardrailsConfig
     
-    def __init__(self, data: dict):
-        self.id = data.get("id")
-        self.tenant_id = data.get("tenant_id")
-        self.name = data.get("name")
-        self.model_provider = data.get("model_provider", "openai")
-        self.model_name = data.get("model_name", "gpt-4o-mini")
-        self.temperature = float(data.get("temperature", 0.7))
-        self.max_tokens = data.get("max_tokens", 1000)
-        self.system_prompt = data.get("system_prompt", "")
-        self.greeting_message = data.get("greeting_message")
-        self.fallback_message = data.get("fallback_message", "Desculpe, não entendi. Pode reformular?")
-        self.handoff_message = data.get("handoff_message", "Vou transferir você para um atendente humano.")
-        self.memory_enabled = data.get("memory_enabled", True)
-        self.memory_window = data.get("memory_window", 10)
-        self.rag_enabled = data.get("rag_enabled", False)
-        self.intent_router_enabled = data.get("intent_router_enabled", True)
-        
-        # Guardrails (Security)
-        self.guardrails_enabled = data.get("guardrails_enabled", False)
-        self.guardrails_config = GuardrailsConfig(
-            enabled=self.guardrails_enabled,
-            input_prompt=data.get("guardrails_input_prompt", ""),
-            output_prompt=data.get("guardrails_output_prompt", ""),
-            blocked_patterns=data.get("guardrails_blocked_patterns"),
-            sensitive_patterns=data.get("guardrails_sensitive_patterns"),
-            block_message=data.get("guardrails_block_message", "Desculpe, não posso ajudar com esse tipo de solicitação."),
-            use_llm_validation=data.get("guardrails_use_llm", True)
+    @classmethod
+    def from_row(cls, data: dict) -> "AgentConfig":
+        """Build the config from an agents row"""
+        guardrails_enabled = data.get("guardrails_enabled", False)
+        return cls(
+            id=data.get("id"),
+            tenant_id=data.get("tenant_id"),
+            name=data.get("name"),
+            model_provider=data.get("model_provider", "openai"),
+            model_name=data.get("model_name", "gpt-4o-mini"),
+            temperature=float(data.get("temperature", 0.7)),
+            max_tokens=data.get("max_tokens", 1000),
+            system_prompt=data.get("system_prompt", ""),
+            greeting_message=data.get("greeting_message"),
+            fallback_message=data.get("fallback_message", "Desculpe, não entendi. Pode reformular?"),
+            handoff_message=data.get("handoff_message", "Vou transferir você para um atendente humano."),
+            memory_enabled=data.get("memory_enabled", True),
+            memory_window=data.get("memory_window", 10),
+            rag_enabled=data.get("rag_enabled", False),
+            intent_router_enabled=data.get("intent_router_enabled", True),
+            guardrails_enabled=guardrails_enabled,
+            guardrails_config=GuardrailsConfig(
+                enabled=guardrails_enabled,
+                input_prompt=data.get("guardrails_input_prompt", ""),
+                output_prompt=data.get("guardrails_output_prompt", ""),
+                blocked_patterns=_as_tuple(data.get("guardrails_blocked_patterns")),
+                sensitive_patterns=_as_tuple(data.get("guardrails_sensitive_patterns")),
+                block_message=data.get("guardrails_block_message", "Desculpe, não posso ajudar com esse tipo de solicitação."),
+                use_llm_validation=data.get("guardrails_use_llm", True)
+            )
         )
 
 
@@ -89,12 +177,14 @@ class ConversationContext:
         lead_id: Optional[str] = None,
         lead_name: Optional[str] = None,
         history: Optional[List[Dict]] = None,
-        custom_data: Optional[Dict] = None
+        custom_data: Optional[Dict] = None,
+        window: int = 10
     ):
         self.conversation_id = conversation_id
         self.lead_id = lead_id
         self.lead_name = lead_name
-        self.history = history or []
+        # Only the last `window` messages are ever sent, so older ones are dropped
+        self.history = deque(history or [], maxlen=window)
         self.custom_data = custom_data or {}
     
     def add_message(self, role: str, content: str):
@@ -102,12 +192,26 @@ class ConversationContext:
         self.history.append({
             "role": role,
             "content": content,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": time.time_ns()
         })
     
     def get_formatted_history(self, window: int = 10) -> List[Dict]:
-        """Get last N messages formatted for LLM"""
-        return self.history[-window:]
+        """
+        Get last N messages formatted for LLM.
+        
+        Long messages more than HISTORY_MASK_AFTER_TURNS turns old are masked
+        with a short extract; their detail rarely matters by then but they
+        would otherwise be re-sent as prompt tokens on every turn.
+        """
+        recent = list(self.history)[-window:]
+        keep_from = len(recent) - HISTORY_MASK_AFTER_TURNS * 2
+        
+        for i in range(max(keep_from, 0)):
+            content = recent[i]["content"]
+            if content and len(content) > HISTORY_MASK_MIN_CHARS:
+                recent[i] = {**recent[i], "content": _mask_content(content)}
+        
+        return recent
 
 
 class AIOrchestrator:
@@ -122,13 +226,34 @@ class AIOrchestrator:
         self._openai_client = None
         self._rag_service = None
         self._security_service = None
+        self._agent_cache: Dict[str, tuple[float, AgentConfig]] = {}
+        self._intent_cache: OrderedDict[str, MessageIntent] = OrderedDict()
+        # conversation_id -> (cached_at, context, history_version after the turn)
+        self._history_cache: OrderedDict[str, tuple[float, ConversationContext, int]] = OrderedDict()
     
     @property
     def openai(self):
-        """Lazy load OpenAI client"""
+        """
+        Lazy load OpenAI client.
+        
+        Intent, generation and streaming calls share one pooled connection
+        set so bursts reuse warm TLS connections; HTTP/2 multiplexing is
+        used when the optional `h2` package is installed.
+        """
         if self._openai_client is None:
+            import httpx
             from openai import AsyncOpenAI
-            self._openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+            self._openai_client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=httpx.AsyncClient(
+                    http2=find_spec("h2") is not None,
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS
+                    ),
+                    timeout=OPENAI_TIMEOUT_SECONDS
+                )
+            )
         return self._openai_client
     
     @property
@@ -166,8 +291,6 @@ class AIOrchestrator:
         7. Save to database
         8. Return response for sending
         """
-        supabase = get_supabase()
-        
         # Step 1: Get or create conversation
         conversation = await self._get_or_create_conversation(
             tenant_id=packet.tenant_id,
@@ -184,30 +307,20 @@ class AIOrchestrator:
             logger.info("Conversation not in AI mode, skipping", mode=conversation.get("mode"))
             return None
         
-        # Step 2: Load agent configuration
-        agent_id = conversation.get("agent_id")
-        if not agent_id:
-            # Get default agent for tenant
-            agent_result = supabase.table("agents").select("*").eq(
-                "tenant_id", packet.tenant_id
-            ).eq("is_default", True).eq("status", "active").single().execute()
+        # Step 2: Load agent configuration (embedded in the conversation row)
+        agent_data = conversation.get("agent")
+        if not agent_data:
+            agent_data = self._get_default_agent(packet.tenant_id)
             
-            if not agent_result.data:
+            if not agent_data:
                 logger.warning("No default agent found", tenant_id=packet.tenant_id)
                 return None
-            
-            agent_id = agent_result.data["id"]
         
-        agent_result = supabase.table("agents").select("*").eq(
-            "id", agent_id
-        ).single().execute()
-        
-        if not agent_result.data:
-            logger.error("Agent not found", agent_id=agent_id)
+        agent = self._get_agent(agent_data["id"], data=agent_data)
+        if not agent:
+            logger.error("Agent not found", agent_id=agent_data["id"])
             return None
         
-        agent = AgentConfig(agent_result.data)
-        
         # Step 3: Load conversation context (history)
         context = await self._load_context(conversation, agent.memory_window)
         
@@ -215,12 +328,35 @@ class AIOrchestrator:
         user_message = self._format_user_message(packet)
         context.add_message("user", user_message)
         
-        # Step 4.5: Guardrails INPUT check
+        # Steps 4.5-6: Guardrails input check, intent detection and RAG
+        # retrieval are independent, so run them concurrently
+        stages = {}
         if agent.guardrails_enabled:
-            input_check = await self.security.check_input(
+            stages["input_check"] = self.security.check_input(
                 message=user_message,
                 config=agent.guardrails_config
             )
+        if agent.intent_router_enabled:
+            stages["intent"] = self._detect_intent(user_message)
+        if agent.rag_enabled:
+            stages["rag_context"] = self.rag.get_context_for_query(
+                tenant_id=packet.tenant_id,
+                query=user_message,
+                agent_id=agent.id,
+                stable_order=True
+            )
+        
+        outcomes = dict(zip(
+            stages,
+            await asyncio.gather(*stages.values(), return_exceptions=True),
+            strict=True
+        ))
+        
+        # Step 4.5: Guardrails INPUT check
+        if "input_check" in outcomes:
+            input_check = outcomes["input_check"]
+            if isinstance(input_check, Exception):
+                raise input_check
             if input_check.blocked:
                 logger.warning(
                     "Guardrails blocked user input",
@@ -229,31 +365,33 @@ class AIOrchestrator:
                     pattern=input_check.matched_pattern
                 )
                 # Save blocked attempt to database
-                await self._save_messages(
+                history_version = await self._save_messages(
                     conversation_id=conversation["id"],
                     tenant_id=packet.tenant_id,
                     user_message=user_message,
                     ai_response=agent.guardrails_config.block_message,
                     packet=packet
                 )
+                self._remember_turn(context, agent.guardrails_config.block_message, history_version)
                 return agent.guardrails_config.block_message
         
         # Step 5: Detect intent (if enabled)
-        intent = MessageIntent.UNKNOWN
-        if agent.intent_router_enabled:
-            intent = await self._detect_intent(user_message)
+        intent = outcomes.get("intent", MessageIntent.UNKNOWN)
+        if isinstance(intent, Exception):
+            logger.error("Intent detection failed", error=str(intent))
+            intent = MessageIntent.UNKNOWN
+        elif "intent" in outcomes:
             logger.info("Intent detected", intent=intent.value)
         
         # Step 6: Get RAG context (if enabled)
         rag_context = ""
-        if agent.rag_enabled:
-            rag_context = await self.rag.get_context_for_query(
-                tenant_id=packet.tenant_id,
-                query=user_message,
-                agent_id=agent.id
-            )
+        rag_result = outcomes.get("rag_context")
+        if isinstance(rag_result, Exception):
+            logger.error("RAG retrieval failed", error=str(rag_result))
+        elif rag_result:
+            rag_context, sources = rag_result
             if rag_context:
-                logger.info("RAG context retrieved", length=len(rag_context))
+                logger.info("RAG context retrieved", length=len(rag_context), sources=sources)
         
         # Step 7: Generate response
         response = await self._generate_response(
@@ -281,13 +419,14 @@ class AIOrchestrator:
                 response = agent.guardrails_config.block_message
         
         # Step 8: Save messages to database
-        await self._save_messages(
+        history_version = await self._save_messages(
             conversation_id=conversation["id"],
             tenant_id=packet.tenant_id,
             user_message=user_message,
             ai_response=response,
             packet=packet
         )
+        self._remember_turn(context, response, history_version)
         
         logger.info(
             "AI response generated",
@@ -307,153 +446,185 @@ class AIOrchestrator:
         phone: str,
         chat_id: str
     ) -> Optional[dict]:
-        """Get existing conversation or create new one"""
-        supabase = get_supabase()
-        
-        # Try to find existing active conversation
-        result = supabase.table("conversations").select("*").eq(
-            "tenant_id", tenant_id
-        ).eq("phone_number", phone).eq("status", "active").single().execute()
-        
-        if result.data:
-            # Update last message timestamp
-            supabase.table("conversations").update({
-                "last_message_at": datetime.utcnow().isoformat()
-            }).eq("id", result.data["id"]).execute()
-            
-            return result.data
-        
-        # Get or create lead
-        lead = await self._get_or_create_lead(tenant_id, phone)
+        """
+        Get existing conversation or create new one.
         
-        # Get default agent
-        agent_result = supabase.table("agents").select("id").eq(
-            "tenant_id", tenant_id
-        ).eq("is_default", True).eq("status", "active").single().execute()
+        The ensure_conversation RPC resolves the lead, default agent and
+        conversation server-side in one round-trip and returns the
+        conversation with its agent embedded.
+        """
+        supabase = get_supabase()
         
-        agent_id = agent_result.data["id"] if agent_result.data else None
-        
-        # Create new conversation
-        new_conv = supabase.table("conversations").insert({
-            "tenant_id": tenant_id,
-            "agent_id": agent_id,
-            "lead_id": lead.get("id") if lead else None,
-            "external_id": chat_id,
-            "channel": "whatsapp",
-            "phone_number": phone,
-            "status": "active",
-            "mode": "ai",
-            "started_at": datetime.utcnow().isoformat(),
-            "last_message_at": datetime.utcnow().isoformat(),
+        result = supabase.rpc("ensure_conversation", {
+            "p_tenant_id": tenant_id,
+            "p_phone": phone,
+            "p_chat_id": chat_id,
         }).execute()
         
-        return new_conv.data[0] if new_conv.data else None
+        return result.data or None
     
-    async def _get_or_create_lead(
+    def _get_agent(
         self,
-        tenant_id: str,
-        phone: str
-    ) -> Optional[dict]:
-        """Get or create a lead for the phone number"""
-        supabase = get_supabase()
-        
-        # Try to find existing lead
-        result = supabase.table("crm_leads").select("*").eq(
-            "tenant_id", tenant_id
-        ).eq("whatsapp", phone).single().execute()
+        agent_id: str,
+        data: Optional[dict] = None,
+        ttl: float = AGENT_CACHE_TTL_SECONDS
+    ) -> Optional[AgentConfig]:
+        """
+        Get agent configuration, reusing the cached AgentConfig for up to
+        `ttl` seconds. `data` is the agent row when the caller already has it.
+        """
+        cached = self._agent_cache.get(agent_id)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
         
-        if result.data:
-            # Update last contact
-            supabase.table("crm_leads").update({
-                "last_contact_at": datetime.utcnow().isoformat()
-            }).eq("id", result.data["id"]).execute()
-            return result.data
+        if data is None:
+            result = get_supabase().table("agents").select("*").eq(
+                "id", agent_id
+            ).single().execute()
+            data = result.data
+            
+            if not data:
+                self._agent_cache.pop(agent_id, None)
+                return None
         
-        # Get first pipeline stage for tenant
-        stage = supabase.table("crm_pipeline_stages").select("id").eq(
+        agent = AgentConfig.from_row(data)
+        self._agent_cache[agent_id] = (time.monotonic(), agent)
+        return agent
+    
+    def invalidate_agent(self, agent_id: str) -> None:
+        """Drop a cached agent configuration after it changes"""
+        self._agent_cache.pop(agent_id, None)
+    
+    def _get_default_agent(self, tenant_id: str) -> Optional[dict]:
+        """Get the active default agent for a tenant"""
+        result = get_supabase().table("agents").select("*").eq(
             "tenant_id", tenant_id
-        ).order("position").limit(1).single().execute()
-        
-        # Create new lead
-        new_lead = supabase.table("crm_leads").insert({
-            "tenant_id": tenant_id,
-            "pipeline_stage_id": stage.data["id"] if stage.data else None,
-            "whatsapp": phone,
-            "phone": phone,
-            "source": "whatsapp",
-            "temperature": "warm",
-            "status": "new",
-        }).execute()
+        ).eq("is_default", True).eq("status", "active").single().execute()
         
-        return new_lead.data[0] if new_lead.data else None
+        return result.data
     
     async def _load_context(
         self,
         conversation: dict,
         window: int = 10
     ) -> ConversationContext:
-        """Load conversation context including message history"""
+        """
+        Load conversation context including message history.
+        
+        The lead name rides along on the history query via embedded
+        resources, and the newest messages are fetched first so the database
+        stops after the window instead of ordering the whole conversation.
+        
+        Contexts of recent turns are kept for HISTORY_CACHE_TTL_SECONDS, so
+        follow-up packets of an active conversation skip the query. A cached
+        context is only reused while the conversation's history_version is
+        still the one this process's save_turn produced; any other write
+        (human agent, another worker, a deleted message) bumps it.
+        """
+        cached = self._history_cache.pop(conversation["id"], None)
+        if (
+            cached
+            and time.monotonic() - cached[0] < HISTORY_CACHE_TTL_SECONDS
+            and cached[1].history.maxlen == window
+            and conversation.get("history_version") == cached[2]
+        ):
+            context = cached[1]
+            return ConversationContext(
+                conversation_id=context.conversation_id,
+                lead_id=context.lead_id,
+                lead_name=context.lead_name,
+                history=list(context.history),
+                window=window
+            )
+        
         supabase = get_supabase()
         
+        # Get message history (newest first) with the lead name embedded
+        messages = supabase.table("messages").select(
+            "sender_type, content, conversation:conversations(lead:crm_leads(name))"
+        ).eq(
+            "conversation_id", conversation["id"]
+        ).eq(
+            "is_deleted", False
+        ).order(
+            "created_at", desc=True
+        ).limit(window * 2).execute()
+        
+        rows = messages.data or []
+        rows.reverse()
+        
         # Get lead info
         lead_name = None
         lead_id = conversation.get("lead_id")
         
-        if lead_id:
+        if rows:
+            lead = (rows[0].get("conversation") or {}).get("lead") or {}
+            lead_name = lead.get("name")
+        elif lead_id:
+            # No history to carry the join, e.g. a new conversation
             lead = supabase.table("crm_leads").select("name").eq(
                 "id", lead_id
             ).single().execute()
             if lead.data:
                 lead_name = lead.data.get("name")
         
-        # Get message history
-        messages = supabase.table("messages").select(
-            "sender_type, content"
-        ).eq(
-            "conversation_id", conversation["id"]
-        ).eq(
-            "is_deleted", False
-        ).order(
-            "created_at", desc=False
-        ).limit(window * 2).execute()
-        
-        history = []
-        for msg in (messages.data or []):
-            role = "assistant" if msg["sender_type"] in ["ai", "agent"] else "user"
-            history.append({
-                "role": role,
-                "content": msg["content"]
-            })
+        history = [
+            {"role": _SENDER_ROLES.get(msg["sender_type"], "user"), "content": msg["content"]}
+            for msg in rows
+        ]
         
         return ConversationContext(
             conversation_id=conversation["id"],
             lead_id=lead_id,
             lead_name=lead_name,
-            history=history[-window:]
+            history=history,
+            window=window
         )
     
+    def _remember_turn(
+        self,
+        context: ConversationContext,
+        ai_response: str,
+        history_version: Optional[int]
+    ):
+        """Record the reply and keep the context warm for the next packet"""
+        context.add_message("assistant", ai_response)
+        
+        if history_version is None:  # save_turn predates history versions
+            return
+        self._history_cache[context.conversation_id] = (time.monotonic(), context, history_version)
+        self._history_cache.move_to_end(context.conversation_id)
+        if len(self._history_cache) > HISTORY_CACHE_MAX_SIZE:
+            self._history_cache.popitem(last=False)
+    
     # ===========================================
     # MESSAGE PROCESSING
     # ===========================================
     
     def _format_user_message(self, packet: BufferedMessagePacket) -> str:
         """Format buffered messages into single user message"""
-        parts = []
-        
-        for msg in packet.messages:
-            if msg.content_type == "text" and msg.content:
-                parts.append(msg.content)
-            elif msg.content_type == "audio":
-                # Audio transcription placeholder
-                parts.append("[Áudio recebido - transcrição pendente]")
-            elif msg.content_type == "image":
-                caption = msg.content or ""
-                parts.append(f"[Imagem recebida]{': ' + caption if caption else ''}")
-        
-        return "\n".join(parts) if parts else "[Mensagem sem conteúdo de texto]"
+        return (
+            "\n".join(filter(None, map(_render_message, packet.messages)))
+            or EMPTY_MESSAGE_PLACEHOLDER
+        )
     
     async def _detect_intent(self, message: str) -> MessageIntent:
-        """Detect the intent of a message using LLM"""
+        """
+        Detect the intent of a message using LLM.
+        
+        Bare greetings and farewells are classified locally, and other
+        classifications are cached by normalized text so repeats skip the LLM.
+        """
+        key = " ".join(message.casefold().split())
+        intent = _LOCAL_INTENTS.get(key.strip(_INTENT_PUNCTUATION))
+        if intent is not None:
+            return intent
+        
+        intent = self._intent_cache.get(key)
+        if intent is not None:
+            self._intent_cache.move_to_end(key)
+            return intent
+        
         try:
             response = await self.openai.chat.completions.create(
                 model="gpt-4o-mini",
@@ -481,61 +652,127 @@ class AIOrchestrator:
             intent_str = response.choices[0].message.content.strip().lower()
             
             try:
-                return MessageIntent(intent_str)
+                intent = MessageIntent(intent_str)
             except ValueError:
-                return MessageIntent.UNKNOWN
+                intent = MessageIntent.UNKNOWN
+            
+            self._intent_cache[key] = intent
+            if len(self._intent_cache) > INTENT_CACHE_MAX_SIZE:
+                self._intent_cache.popitem(last=False)
+            
+            return intent
                 
         except Exception as e:
             logger.error("Intent detection failed", error=str(e))
             return MessageIntent.UNKNOWN
     
-    async def _generate_response(
+    async def _stream_response(
         self,
         agent: AgentConfig,
         context: ConversationContext,
         user_message: str,
         rag_context: str = "",
         intent: MessageIntent = MessageIntent.UNKNOWN
-    ) -> str:
-        """Generate AI response using configured LLM"""
+    ) -> AsyncIterator[str]:
+        """
+        Stream the AI response from the configured LLM, yielding text deltas.
+        
+        The agent's system prompt is sent byte-identical on every turn as the
+        first message, and per-turn context (lead name, RAG) goes in a later
+        system message, so the provider can reuse its cached prompt prefix.
+        """
         
-        # Build system prompt
-        system_prompt = agent.system_prompt
+        # Build per-turn context
+        dynamic_parts = []
         
         # Add customer context
         if context.lead_name:
-            system_prompt += f"\n\nNome do cliente: {context.lead_name}"
+            dynamic_parts.append(f"Nome do cliente: {context.lead_name}")
         
         # Add RAG context
         if rag_context:
-            system_prompt += f"""
-
-### Base de Conhecimento
+            dynamic_parts.append(f"""### Base de Conhecimento
 Use as informações abaixo para responder de forma precisa:
 
 {rag_context}
 
 ---
-Se a informação não estiver na base de conhecimento acima, diga que não tem essa informação no momento."""
+Se a informação não estiver na base de conhecimento acima, diga que não tem essa informação no momento.""")
         
-        # Build messages
-        messages = [{"role": "system", "content": system_prompt}]
+        # Build messages: static prefix first, then history, then per-turn context
+        messages = [{"role": "system", "content": agent.system_prompt.rstrip()}]
         messages.extend(context.get_formatted_history(agent.memory_window))
+        if dynamic_parts:
+            messages.append({"role": "system", "content": "\n\n".join(dynamic_parts)})
         messages.append({"role": "user", "content": user_message})
         
+        stream = await self.openai.chat.completions.create(
+            model=agent.model_name,
+            messages=messages,
+            max_tokens=agent.max_tokens,
+            temperature=agent.temperature,
+            stream=True
+        )
+        
         try:
-            response = await self.openai.chat.completions.create(
-                model=agent.model_name,
-                messages=messages,
-                max_tokens=agent.max_tokens,
-                temperature=agent.temperature
-            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Release the connection even when the consumer stops early
+            await stream.response.aclose()
+    
+    async def _generate_response(
+        self,
+        agent: AgentConfig,
+        context: ConversationContext,
+        user_message: str,
+        rag_context: str = "",
+        intent: MessageIntent = MessageIntent.UNKNOWN
+    ) -> str:
+        """
+        Generate AI response using configured LLM.
+        
+        The response is streamed and accumulated. With guardrails enabled the
+        partial text is pattern-checked as it arrives, and generation stops
+        at the first sensitive match since the output check would block the
+        full response anyway. Each scan covers only the text added since the
+        last one plus a short overlap, keeping the work linear in the
+        response length; the full output check still runs on the result.
+        """
+        text = ""
+        checked = 0
+        stream = self._stream_response(
+            agent=agent,
+            context=context,
+            user_message=user_message,
+            rag_context=rag_context,
+            intent=intent
+        )
+        
+        try:
+            async for delta in stream:
+                text += delta
+                
+                if (
+                    agent.guardrails_enabled
+                    and len(text) - checked >= STREAM_CHECK_INTERVAL_CHARS
+                ):
+                    window = text[max(0, checked - STREAM_CHECK_OVERLAP_CHARS):]
+                    checked = len(text)
+                    if self.security.check_output_patterns(
+                        window, agent.guardrails_config
+                    ).blocked:
+                        logger.warning("Sensitive output detected mid-stream, stopping generation")
+                        break
             
-            return response.choices[0].message.content.strip()
+            return text.strip() or agent.fallback_message
             
         except Exception as e:
             logger.error("LLM generation failed", error=str(e))
             return agent.fallback_message
+        finally:
+            await stream.aclose()
     
     async def _save_messages(
         self,
@@ -544,39 +781,24 @@ Se a informação não estiver na base de conhecimento acima, diga que não tem
         user_message: str,
         ai_response: str,
         packet: BufferedMessagePacket
-    ):
-        """Save user and AI messages to database"""
-        supabase = get_supabase()
+    ) -> Optional[int]:
+        """
+        Save user and AI messages to database.
         
-        # Save user message
-        supabase.table("messages").insert({
-            "conversation_id": conversation_id,
-            "tenant_id": tenant_id,
-            "sender_type": "customer",
-            "sender_name": None,
-            "content": user_message,
-            "content_type": "text" if not packet.has_audio else "mixed",
-        }).execute()
+        Both inserts and the conversation counter update run server-side in
+        the save_turn RPC, so a turn costs one round-trip. Returns the
+        conversation's history_version after the turn.
+        """
+        supabase = get_supabase()
         
-        # Save AI response
-        supabase.table("messages").insert({
-            "conversation_id": conversation_id,
-            "tenant_id": tenant_id,
-            "sender_type": "ai",
-            "content": ai_response,
-            "content_type": "text",
+        result = supabase.rpc("save_turn", {
+            "p_conversation_id": conversation_id,
+            "p_tenant_id": tenant_id,
+            "p_user_message": user_message,
+            "p_user_content_type": "text" if not packet.has_audio else "mixed",
+            "p_ai_response": ai_response,
         }).execute()
-        
-        # Update conversation message count
-        supabase.table("conversations").update({
-            "message_count": supabase.table("messages").select("id", count="exact").eq(
-                "conversation_id", conversation_id
-            ).execute().count,
-            "last_message_at": datetime.utcnow().isoformat(),
-            "ai_message_count": supabase.table("messages").select("id", count="exact").eq(
-                "conversation_id", conversation_id
-            ).eq("sender_type", "ai").execute().count
-        }).eq("id", conversation_id).execute()
+        return (result.data or {}).get("history_version")
 
 
 # Singleton instance
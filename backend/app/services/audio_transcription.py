@@ -6,17 +6,81 @@ Handles audio message transcription using OpenAI Whisper.
 Supports multiple audio formats commonly used in WhatsApp.
 """
 
+import asyncio
 import os
-import tempfile
 import time
-from typing import Optional, Tuple
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Tuple, Union
 from dataclasses import dataclass
 from enum import Enum
+from urllib.parse import urlparse
 import aiohttp
+import orjson
 import structlog
 
 logger = structlog.get_logger()
 
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Bytes per chunk streamed from the CDN to OpenAI
+READ_AHEAD_CHUNKS = 8  # Downloaded chunks buffered ahead of the upload
+
+# The CDN download is read while it is being uploaded, so it gets no total
+# deadline, only short connect/read stalls; the Whisper call gets a long one.
+DL_TIMEOUT = aiohttp.ClientTimeout(total=None, connect=10, sock_read=30)
+UP_TIMEOUT = aiohttp.ClientTimeout(total=300, connect=10)
+
+# Shared by downloads from the WhatsApp CDN and uploads to OpenAI
+_SESSION: Optional[aiohttp.ClientSession] = None
+
+
+def _get_shared_session() -> aiohttp.ClientSession:
+    """Get or create the process-wide session (must run inside the event loop)."""
+    global _SESSION
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=200,
+                limit_per_host=64,
+                ttl_dns_cache=300,
+                keepalive_timeout=75,
+                enable_cleanup_closed=True
+            )
+        )
+    return _SESSION
+
+
+async def _read_ahead(
+    chunks: AsyncIterator[bytes],
+    depth: int = READ_AHEAD_CHUNKS
+) -> AsyncIterator[bytes]:
+    """
+    Pull `chunks` in a background task through a bounded queue, so the next
+    download chunks arrive while the current one is being uploaded. Resident
+    memory stays at `depth` chunks; producer errors re-raise in the consumer.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    done = object()
+    
+    async def produce():
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+            await queue.put(done)
+        except Exception as e:
+            await queue.put(e)
+    
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
 
 class AudioFormat(str, Enum):
     """Supported audio formats."""
@@ -31,6 +95,37 @@ class AudioFormat(str, Enum):
     MPGA = "mpga"
 
 
+_EXT_MAP = {f".{fmt.value}": fmt.value for fmt in AudioFormat}
+_CT_MAP = {
+    "audio/ogg": "ogg",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/mp4": "m4a",
+    "audio/m4a": "m4a",
+    "audio/webm": "webm",
+    "video/mp4": "mp4",
+    # Legacy / non-standard aliases
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-m4a": "m4a",
+    "audio/x-mpeg": "mp3",
+}
+
+
+@lru_cache(maxsize=1024)
+def _format_for(ext: str, content_type: str) -> Optional[str]:
+    """Resolve an audio format from a URL extension, then the content type."""
+    # Try URL extension first
+    fmt = _EXT_MAP.get(ext)
+    if fmt:
+        return fmt
+    
+    # Try content type (media type only, parameters such as codecs dropped)
+    return _CT_MAP.get(content_type.split(";", 1)[0].strip().lower())
+
+
 @dataclass
 class TranscriptionResult:
     """Result of audio transcription."""
@@ -62,18 +157,56 @@ class AudioTranscriptionService:
         if not self.api_key:
             logger.warning("OpenAI API key not configured for transcription")
         
-        self._session: Optional[aiohttp.ClientSession] = None
+        # Caps in-flight Whisper calls so bursts queue instead of hitting 429s.
+        # A counter guarded by a Condition (rather than a Semaphore) lets the
+        # limit be resized safely at runtime.
+        self._active = 0
+        self._cmax = int(os.getenv("WHISPER_CONCURRENCY", "4"))
+        self._cond = asyncio.Condition()
     
     async def _get_session(self) -> aiohttp.ClientSession:
-        """Get or create aiohttp session."""
-        if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
-        return self._session
+        """Get the process-wide aiohttp session."""
+        return _get_shared_session()
+    
+    async def warm(self):
+        """Open the pooled HTTP session ahead of the first transcription."""
+        await self._get_session()
+    
+    async def set_concurrency(self, n: int):
+        """Change the max number of concurrent Whisper calls."""
+        if n < 1:
+            raise ValueError("Concurrency must be at least 1")
+        async with self._cond:
+            self._cmax = n
+            self._cond.notify_all()
+    
+    async def _acquire(self):
+        """Wait for a free concurrency slot and take it."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._active < self._cmax)
+            self._active += 1
+    
+    async def _release(self):
+        """Return a concurrency slot and wake one waiter."""
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify(1)
+    
+    @asynccontextmanager
+    async def _slot(self):
+        """Hold one of the concurrency slots for the duration of the block."""
+        await self._acquire()
+        try:
+            yield
+        finally:
+            await self._release()
     
     async def close(self):
         """Close the HTTP session."""
-        if self._session and not self._session.closed:
-            await self._session.close()
+        global _SESSION
+        if _SESSION is not None and not _SESSION.closed:
+            await _SESSION.close()
+        _SESSION = None
     
     async def transcribe_from_url(
         self,
@@ -94,30 +227,31 @@ class AudioTranscriptionService:
         """
         start_time = time.time()
         
-        # Download audio file
+        # Download audio file, streaming it straight into the upload. The
+        # slot is taken before connecting, so queued audios hold no sockets.
         session = await self._get_session()
-        async with session.get(audio_url) as response:
+        async with self._slot(), session.get(audio_url, timeout=DL_TIMEOUT) as response:
             if response.status != 200:
                 raise ValueError(f"Failed to download audio: HTTP {response.status}")
-            
-            content = await response.read()
+
+            # Reject oversize files before reading the body; without a
+            # Content-Length the limit is enforced while streaming instead
+            content_length = response.content_length
+            if content_length is not None and content_length > self.MAX_FILE_SIZE_MB * 1024 * 1024:
+                raise ValueError(f"Audio file too large: over {self.MAX_FILE_SIZE_MB}MB")
+
             content_type = response.headers.get("Content-Type", "")
             
-            # Check file size
-            size_mb = len(content) / (1024 * 1024)
-            if size_mb > self.MAX_FILE_SIZE_MB:
-                raise ValueError(f"Audio file too large: {size_mb:.1f}MB (max {self.MAX_FILE_SIZE_MB}MB)")
-        
-        # Determine format from URL or content type
-        format_ext = self._detect_format(audio_url, content_type)
-        
-        # Transcribe
-        result = await self._transcribe_bytes(
-            content,
-            format_ext,
-            language=language,
-            prompt=prompt
-        )
+            # Determine format from URL or content type
+            format_ext = self._detect_format(audio_url, content_type)
+            
+            # Transcribe
+            result = await self._post_transcription(
+                _read_ahead(self._iter_limited(response.content)),
+                format_ext,
+                language=language,
+                prompt=prompt
+            )
         
         result.processing_time_ms = int((time.time() - start_time) * 1000)
         return result
@@ -142,18 +276,44 @@ class AudioTranscriptionService:
             TranscriptionResult with text and metadata
         """
         start_time = time.time()
-        result = await self._transcribe_bytes(audio_data, format_ext, language, prompt)
+        result = await self._transcribe(audio_data, format_ext, language, prompt)
         result.processing_time_ms = int((time.time() - start_time) * 1000)
         return result
     
-    async def _transcribe_bytes(
+    async def _iter_limited(self, content: aiohttp.StreamReader) -> AsyncIterator[bytes]:
+        """Yield downloaded chunks, failing once the file exceeds the size limit."""
+        max_bytes = self.MAX_FILE_SIZE_MB * 1024 * 1024
+        total = 0
+        async for chunk in content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > max_bytes:
+                raise ValueError(f"Audio file too large: over {self.MAX_FILE_SIZE_MB}MB")
+            yield chunk
+    
+    async def _transcribe(
         self,
-        audio_data: bytes,
+        audio: Union[bytes, AsyncIterator[bytes]],
         format_ext: str,
         language: Optional[str] = None,
         prompt: Optional[str] = None
     ) -> TranscriptionResult:
-        """Internal transcription method."""
+        """Internal transcription method; waits for a concurrency slot."""
+        async with self._slot():
+            return await self._post_transcription(audio, format_ext, language, prompt)
+    
+    async def _post_transcription(
+        self,
+        audio: Union[bytes, AsyncIterator[bytes]],
+        format_ext: str,
+        language: Optional[str] = None,
+        prompt: Optional[str] = None
+    ) -> TranscriptionResult:
+        """
+        Send audio to Whisper. The caller must hold a concurrency slot.
+        
+        `audio` is either the raw bytes or an async iterator of chunks, which
+        is sent as the multipart file field without buffering it first.
+        """
         if not self.api_key:
             raise ValueError("OpenAI API key not configured")
         
@@ -162,83 +322,52 @@ class AudioTranscriptionService:
         if format_ext not in self.SUPPORTED_FORMATS:
             raise ValueError(f"Unsupported audio format: {format_ext}")
         
-        # Write to temp file (OpenAI API requires file)
-        with tempfile.NamedTemporaryFile(suffix=f".{format_ext}", delete=False) as tmp:
-            tmp.write(audio_data)
-            tmp_path = tmp.name
+        session = await self._get_session()
         
-        try:
-            session = await self._get_session()
-            
-            # Prepare multipart form data
-            form_data = aiohttp.FormData()
-            form_data.add_field(
-                "file",
-                open(tmp_path, "rb"),
-                filename=f"audio.{format_ext}",
-                content_type=self._get_mime_type(format_ext)
-            )
-            form_data.add_field("model", "whisper-1")
-            form_data.add_field("response_format", "verbose_json")
-            
-            if language:
-                form_data.add_field("language", language)
-            
-            if prompt:
-                form_data.add_field("prompt", prompt)
-            
-            # Call OpenAI API
-            async with session.post(
-                "https://api.openai.com/v1/audio/transcriptions",
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                data=form_data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    logger.error("Transcription API error", status=response.status, error=error_text)
-                    raise ValueError(f"Transcription failed: {error_text}")
-                
-                result = await response.json()
-            
-            return TranscriptionResult(
-                text=result.get("text", "").strip(),
-                duration_seconds=result.get("duration", 0),
-                language=result.get("language", language or "unknown"),
-                confidence=None  # Whisper doesn't provide confidence
-            )
+        # Prepare multipart form data
+        form_data = aiohttp.FormData()
+        form_data.add_field(
+            "file",
+            audio,
+            filename=f"audio.{format_ext}",
+            content_type=self._get_mime_type(format_ext)
+        )
+        form_data.add_field("model", "whisper-1")
+        form_data.add_field("response_format", "verbose_json")
+        
+        if language:
+            form_data.add_field("language", language)
+        
+        if prompt:
+            form_data.add_field("prompt", prompt)
+        
+        # Call OpenAI API
+        async with session.post(
+            "https://api.openai.com/v1/audio/transcriptions",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            data=form_data,
+            timeout=UP_TIMEOUT
+        ) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error("Transcription API error", status=response.status, error=error_text)
+                raise ValueError(f"Transcription failed: {error_text}")
             
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+            result = orjson.loads(await response.read())
+        
+        return TranscriptionResult(
+            text=result.get("text", "").strip(),
+            duration_seconds=result.get("duration", 0),
+            language=result.get("language", language or "unknown"),
+            confidence=None  # Whisper doesn't provide confidence
+        )
     
     def _detect_format(self, url: str, content_type: str) -> str:
         """Detect audio format from URL or content type."""
-        # Try URL extension first
-        url_lower = url.lower().split("?")[0]  # Remove query params
-        for fmt in AudioFormat:
-            if url_lower.endswith(f".{fmt.value}"):
-                return fmt.value
-        
-        # Try content type
-        content_type_map = {
-            "audio/ogg": "ogg",
-            "audio/opus": "opus",
-            "audio/mpeg": "mp3",
-            "audio/mp3": "mp3",
-            "audio/wav": "wav",
-            "audio/x-wav": "wav",
-            "audio/mp4": "m4a",
-            "audio/m4a": "m4a",
-            "audio/webm": "webm",
-            "video/mp4": "mp4",
-        }
-        
-        for ct, fmt in content_type_map.items():
-            if ct in content_type.lower():
-                return fmt
+        ext = os.path.splitext(urlparse(url).path)[1].lower()
+        fmt = _format_for(ext, content_type)
+        if fmt:
+            return fmt
         
         # Default to ogg (common for WhatsApp)
         logger.warning("Could not detect audio format, defaulting to ogg", url=url, content_type=content_type)
@@ -260,16 +389,10 @@ class AudioTranscriptionService:
         return mime_types.get(format_ext, "application/octet-stream")
 
 
-# Singleton instance
-_transcription_service: Optional[AudioTranscriptionService] = None
-
-
+@lru_cache
 def get_transcription_service() -> AudioTranscriptionService:
     """Get singleton AudioTranscriptionService instance."""
-    global _transcription_service
-    if _transcription_service is None:
-        _transcription_service = AudioTranscriptionService()
-    return _transcription_service
+    return AudioTranscriptionService()
 
 
 # ===========================================
@@ -317,3 +440,25 @@ async def transcribe_whatsapp_audio(
             error=str(e)
         )
         raise
+
+
+async def transcribe_many(
+    audio_urls: List[str],
+    language: Optional[str] = None,
+    prompt: Optional[str] = None
+) -> List[Union[TranscriptionResult, Exception]]:
+    """
+    Transcribe several audio URLs concurrently.
+    
+    All calls share the service's WHISPER_CONCURRENCY limit, so a batch of
+    webhook audios queues behind it instead of flooding the API. Failures are
+    returned in place of their result rather than cancelling the batch.
+    """
+    service = get_transcription_service()
+    return await asyncio.gather(
+        *(
+            service.transcribe_from_url(url, language=language, prompt=prompt)
+            for url in audio_urls
+        ),
+        return_exceptions=True
+    )
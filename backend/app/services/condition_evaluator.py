@@ -6,12 +6,158 @@ Evaluates dynamic conditions before executing automations.
 Supports various operators and field types.
 """
 
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional
 from datetime import datetime, timezone, timedelta
+from collections import OrderedDict
+from functools import lru_cache
+import logging
+import sys
 import structlog
 
 logger = structlog.get_logger()
 
+# Level check without building a structlog event (structlog uses stdlib loggers)
+_std_logger = logging.getLogger(__name__)
+
+# A compiled condition-set: (context, trace=None) -> whether the conditions
+# are met. When a trace list is passed, (field, operator, result) tuples are
+# appended to it for each condition evaluated.
+ConditionPlan = Callable[..., bool]
+
+PLAN_CACHE_MAX_SIZE = 1024  # Distinct condition-sets kept compiled (LRU)
+
+
+def _freeze(value: Any) -> Any:
+    """
+    Hashable form of a JSON-like condition value (lists/dicts -> tuples).
+    Scalars are tagged with their type so 1, 1.0 and True stay distinct.
+    """
+    if isinstance(value, list):
+        return (list, tuple(_freeze(v) for v in value))
+    if isinstance(value, dict):
+        return (dict, tuple(sorted((k, _freeze(v)) for k, v in value.items())))
+    return (type(value), value)
+
+
+@lru_cache(maxsize=2048)
+def _split_path(field: str) -> tuple:
+    """Split a dot-notation field into interned keys (few distinct fields exist)."""
+    return tuple(sys.intern(key) for key in field.split("."))
+
+
+def _resolve(data: Any, keys: tuple) -> Any:
+    value = data
+    for key in keys:
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif hasattr(value, key):
+            value = getattr(value, key)
+        else:
+            return None
+    return value
+
+
+def _make_getter(field: str) -> Callable[[Any], Any]:
+    """Build an accessor for a dot-notation field with the path split once."""
+    keys = _split_path(field)
+    
+    if len(keys) == 1:
+        key = keys[0]
+        
+        def get(data: Any) -> Any:
+            if isinstance(data, dict):
+                return data.get(key)
+            if hasattr(data, key):
+                return getattr(data, key)
+            return None
+        
+        return get
+    
+    def get(data: Any) -> Any:
+        return _resolve(data, keys)
+    
+    return get
+
+
+def _always_true(actual: Any, expected: Any) -> bool:
+    return True
+
+
+# Same-type values of these compare directly instead of as casefolded strings
+_EXACT_TYPES = (int, float, bool)
+
+
+def _equals_operator(expected: Any, negate: bool = False) -> Callable[[Any, Any], bool]:
+    """equals / not_equals with the expected value casefolded once."""
+    if_none = expected is None or expected == ""
+    exact = type(expected) in _EXACT_TYPES
+    expected_type = type(expected)
+    folded = str(expected).casefold()
+    
+    def op(actual: Any, _expected: Any) -> bool:
+        if actual is None:
+            return if_none is not negate
+        if exact and type(actual) is expected_type:
+            return (actual == expected) is not negate
+        return (str(actual).casefold() == folded) is not negate
+    
+    return op
+
+
+def _contains_operator(expected: Any, negate: bool = False) -> Callable[[Any, Any], bool]:
+    """contains / not_contains with the expected value casefolded once."""
+    folded = str(expected).casefold()
+    
+    def op(actual: Any, _expected: Any) -> bool:
+        if actual is None:
+            return negate
+        if isinstance(actual, list):
+            return (expected in actual) is not negate
+        return (folded in str(actual).casefold()) is not negate
+    
+    return op
+
+
+def _in_list_operator(expected: Any, negate: bool = False) -> Callable[[Any, Any], bool]:
+    """in_list / not_in_list with the expected values casefolded into a set once."""
+    values = expected if isinstance(expected, list) else [expected]
+    has_none = None in values
+    folded = frozenset(str(e).casefold() for e in values)
+    
+    def op(actual: Any, _expected: Any) -> bool:
+        if actual is None:
+            return has_none is not negate
+        return (str(actual).casefold() in folded) is not negate
+    
+    return op
+
+
+# Operators whose expected value is preprocessed when a plan is compiled.
+# Negated operators are fused rather than wrapping their positive form.
+_SPECIALIZED_OPERATORS: Dict[str, Callable[[Any], Callable[[Any, Any], bool]]] = {
+    "equals": _equals_operator,
+    "not_equals": lambda expected: _equals_operator(expected, negate=True),
+    "contains": _contains_operator,
+    "not_contains": lambda expected: _contains_operator(expected, negate=True),
+    "in_list": _in_list_operator,
+    "not_in_list": lambda expected: _in_list_operator(expected, negate=True),
+}
+
+
+@lru_cache(maxsize=256)
+def _days(days: int) -> timedelta:
+    return timedelta(days=days)
+
+
+@lru_cache(maxsize=1024)
+def _parse_iso(value: str) -> datetime:
+    """
+    Parse an ISO timestamp. Memoized because the same contact date is often
+    compared against several thresholds. fromisoformat is C-implemented and
+    accepts a trailing "Z" on Python 3.11+.
+    """
+    return datetime.fromisoformat(value)
+
 
 class ConditionEvaluator:
     """
@@ -43,6 +189,8 @@ class ConditionEvaluator:
             "days_ago_greater": self._op_days_ago_greater,
             "days_ago_less": self._op_days_ago_less,
         }
+        self._plans: OrderedDict[Any, ConditionPlan] = OrderedDict()
+        self._now: Optional[datetime] = None  # Shared "now" while evaluate_all runs
     
     def evaluate_all(
         self, 
@@ -64,12 +212,93 @@ class ConditionEvaluator:
         if not conditions:
             return True
         
-        results = [self.evaluate_single(cond, context) for cond in conditions]
+        plan = self.compile(conditions, match_type)
+        trace = [] if _std_logger.isEnabledFor(logging.DEBUG) else None
+        self._now = datetime.now(timezone.utc)
+        try:
+            result = plan(context, trace)
+        finally:
+            self._now = None
         
-        if match_type == "all":
-            return all(results)
-        else:  # "any"
-            return any(results)
+        if trace is not None:
+            logger.debug("Conditions evaluated", match_type=match_type, result=result, trace=trace)
+        return result
+    
+    def compile(
+        self,
+        conditions: List[Dict[str, Any]],
+        match_type: str = "all"
+    ) -> ConditionPlan:
+        """
+        Compile a condition-set into a single callable.
+        
+        Field accessors and operator functions are resolved once, so
+        evaluating the plan does no operator lookups or path splitting.
+        Plans are cached by the conditions' content.
+        """
+        key = (match_type, tuple(
+            (cond.get("field"), cond.get("operator"), _freeze(cond.get("value")))
+            for cond in conditions
+        ))
+        try:
+            plan = self._plans.get(key)
+        except TypeError:  # Unhashable value, compile without caching
+            return self._build_plan(conditions, match_type)
+        
+        if plan is None:
+            plan = self._build_plan(conditions, match_type)
+            self._plans[key] = plan
+            if len(self._plans) > PLAN_CACHE_MAX_SIZE:
+                self._plans.popitem(last=False)
+        else:
+            self._plans.move_to_end(key)
+        return plan
+    
+    def _build_plan(
+        self,
+        conditions: List[Dict[str, Any]],
+        match_type: str
+    ) -> ConditionPlan:
+        """Build the plan for a condition-set (see compile)."""
+        steps = []
+        for condition in conditions:
+            field = condition.get("field")
+            operator = condition.get("operator")
+            expected = condition.get("value")
+            
+            if not field or not operator:
+                logger.warning("Invalid condition", condition=condition)
+                steps.append((_make_getter(""), _always_true, expected, condition))
+                continue
+            
+            specialize = _SPECIALIZED_OPERATORS.get(operator)
+            if specialize:
+                op_func = specialize(expected)
+            else:
+                op_func = self.operators.get(operator)
+                if not op_func:
+                    logger.warning("Unknown operator", operator=operator)
+                    op_func = _always_true
+            
+            steps.append((_make_getter(field), op_func, expected, condition))
+        
+        # "all" stops at the first False, "any" at the first True
+        stop_on = match_type != "all"
+        
+        def plan(context: Dict[str, Any], trace: Optional[list] = None) -> bool:
+            for get, op_func, expected, condition in steps:
+                try:
+                    result = bool(op_func(get(context), expected))
+                except Exception as e:
+                    logger.error("Condition evaluation error", error=str(e), condition=condition)
+                    result = False
+                if trace is not None:
+                    trace.append((condition.get("field"), condition.get("operator"), result))
+                if result is stop_on:
+                    return stop_on
+            return not stop_on
+        
+        return plan
     
     def evaluate_single(self, condition: Dict[str, Any], context: Dict[str, Any]) -> bool:
         """
@@ -101,14 +330,15 @@ class ConditionEvaluator:
         
         try:
             result = op_func(actual_value, expected_value)
-            logger.debug(
-                "Condition evaluated",
-                field=field,
-                operator=operator,
-                expected=expected_value,
-                actual=actual_value,
-                result=result
-            )
+            if _std_logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Condition evaluated",
+                    field=field,
+                    operator=operator,
+                    expected=expected_value,
+                    actual=actual_value,
+                    result=result
+                )
             return result
         except Exception as e:
             logger.error("Condition evaluation error", error=str(e), condition=condition)
@@ -116,18 +346,7 @@ class ConditionEvaluator:
     
     def _get_nested_value(self, data: Dict, field: str) -> Any:
         """Get value from nested dict using dot notation (e.g., 'contact.tags')"""
-        keys = field.split(".")
-        value = data
-        
-        for key in keys:
-            if isinstance(value, dict):
-                value = value.get(key)
-            elif hasattr(value, key):
-                value = getattr(value, key)
-            else:
-                return None
-        
-        return value
+        return _resolve(data, _split_path(field))
     
     # =========================================================================
     # OPERATOR IMPLEMENTATIONS
@@ -136,7 +355,9 @@ class ConditionEvaluator:
     def _op_equals(self, actual: Any, expected: Any) -> bool:
         if actual is None:
             return expected is None or expected == ""
-        return str(actual).lower() == str(expected).lower()
+        if type(actual) is type(expected) and type(actual) in _EXACT_TYPES:
+            return actual == expected
+        return str(actual).casefold() == str(expected).casefold()
     
     def _op_not_equals(self, actual: Any, expected: Any) -> bool:
         return not self._op_equals(actual, expected)
@@ -170,7 +391,7 @@ class ConditionEvaluator:
             return False
         if isinstance(actual, list):
             return expected in actual
-        return str(expected).lower() in str(actual).lower()
+        return str(expected).casefold() in str(actual).casefold()
     
     def _op_not_contains(self, actual: Any, expected: Any) -> bool:
         return not self._op_contains(actual, expected)
@@ -190,7 +411,7 @@ class ConditionEvaluator:
             expected = [expected]
         if actual is None:
             return None in expected
-        return str(actual).lower() in [str(e).lower() for e in expected]
+        return str(actual).casefold() in {str(e).casefold() for e in expected}
     
     def _op_not_in_list(self, actual: Any, expected: Any) -> bool:
         return not self._op_in_list(actual, expected)
@@ -203,11 +424,11 @@ class ConditionEvaluator:
         
         try:
             if isinstance(actual, str):
-                date = datetime.fromisoformat(actual.replace("Z", "+00:00"))
+                date = _parse_iso(actual)
             else:
                 date = actual
             
-            threshold = datetime.now(timezone.utc) - timedelta(days=days)
+            threshold = (self._now or datetime.now(timezone.utc)) - _days(days)
             return date < threshold
         except Exception:
             return False
@@ -220,11 +441,11 @@ class ConditionEvaluator:
         
         try:
             if isinstance(actual, str):
-                date = datetime.fromisoformat(actual.replace("Z", "+00:00"))
+                date = _parse_iso(actual)
             else:
                 date = actual
             
-            threshold = datetime.now(timezone.utc) - timedelta(days=days)
+            threshold = (self._now or datetime.now(timezone.utc)) - _days(days)
             return date >= threshold
         except Exception:
             return False
@@ -9,8 +9,10 @@ Handles the lifecycle of Deals (cycles) in the CRM:
 - Reset cycles for returning contacts
 """
 
-from datetime import datetime, timezone
-from typing import Optional, List, Dict, Any
+import asyncio
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Optional, List, Dict, Any, Callable, Tuple
 from uuid import UUID
 import structlog
 
@@ -18,6 +20,18 @@ from app.core.database import get_tenant_supabase
 
 logger = structlog.get_logger()
 
+JOURNEY_CACHE_TTL_SECONDS = 30  # Journeys change rarely, deals move constantly
+
+# tenant_id -> (fetched_at, {stage_id: active pipeline_entry journeys})
+_JOURNEY_CACHE: Dict[str, Tuple[float, Dict[str, List[Dict[str, Any]]]]] = {}
+
+# Columns a pipeline board renders; all covered by idx_crm_deals_pipeline_board
+# so the listing is an index-only scan (no metadata/notes blobs on the wire)
+PIPELINE_BOARD_COLUMNS = [
+    "id", "contact_id", "contact_name", "pipeline_id", "current_stage_id",
+    "value", "cycle_number", "status", "created_at",
+]
+
 
 class DealManager:
     """Manages CRM deals (cycles) and their lifecycle"""
@@ -26,27 +40,38 @@ class DealManager:
         self.tenant_id = tenant_id
         self.supabase = get_tenant_supabase(supabase_url, supabase_key)
     
+    @classmethod
+    def invalidate_journeys(cls, tenant_id: str):
+        """Drop the cached pipeline_entry journeys of a tenant (call after journey changes)."""
+        _JOURNEY_CACHE.pop(tenant_id, None)
+    
     async def get_deal(self, deal_id: str) -> Optional[Dict[str, Any]]:
         """Get a deal by ID with its history"""
-        result = self.supabase.table("crm_deals").select("*").eq("id", deal_id).single().execute()
+        result = await self._db(lambda: self.supabase.table("crm_deals").select("*").eq("id", deal_id).single().execute())
         return result.data if result.data else None
     
     async def get_deals_by_pipeline(
         self, 
         pipeline_id: str, 
         status: str = "open",
-        limit: int = 100
+        limit: int = 100,
+        columns: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
-        """Get all deals for a pipeline, optionally filtered by status"""
-        query = self.supabase.table("crm_deals").select("*").eq("pipeline_id", pipeline_id)
+        """
+        Get all deals for a pipeline, optionally filtered by status.
+        Returns PIPELINE_BOARD_COLUMNS unless other columns are requested
+        (pass ["*"] for full rows).
+        """
+        select = ",".join(columns or PIPELINE_BOARD_COLUMNS)
+        query = self.supabase.table("crm_deals").select(select).eq("pipeline_id", pipeline_id)
         if status:
             query = query.eq("status", status)
-        result = query.order("created_at", desc=True).limit(limit).execute()
+        result = await self._db(lambda: query.order("created_at", desc=True).limit(limit).execute())
         return result.data or []
     
     async def get_deals_by_contact(self, contact_id: str) -> List[Dict[str, Any]]:
         """Get all deals (cycles) for a contact"""
-        result = self.supabase.table("crm_deals").select("*").eq("contact_id", contact_id).order("cycle_number", desc=True).execute()
+        result = await self._db(lambda: self.supabase.table("crm_deals").select("*").eq("contact_id", contact_id).order("cycle_number", desc=True).execute())
         return result.data or []
     
     async def create_deal(
@@ -63,41 +88,34 @@ class DealManager:
         Create a new deal (cycle) for a contact.
         Automatically calculates cycle_number based on previous deals.
         """
-        # Get existing deals for this contact in this pipeline
-        existing = await self.get_deals_by_contact(contact_id)
-        pipeline_cycles = [d for d in existing if d.get("pipeline_id") == pipeline_id]
-        cycle_number = len(pipeline_cycles) + 1
-        
-        # Create the deal
-        deal_data = {
-            "contact_id": contact_id,
-            "contact_name": contact_name,
-            "contact_phone": contact_phone,
-            "pipeline_id": pipeline_id,
-            "current_stage_id": initial_stage_id,
-            "value": value,
-            "cycle_number": cycle_number,
-            "status": "open",
-            "metadata": metadata or {},
-        }
-        
-        result = self.supabase.table("crm_deals").insert(deal_data).execute()
-        deal = result.data[0] if result.data else None
+        # cycle_number is computed by the insert itself (one round-trip)
+        result = await self._db(lambda: self.supabase.rpc("create_deal_with_cycle", {
+            "p_contact_id": contact_id,
+            "p_pipeline_id": pipeline_id,
+            "p_stage_id": initial_stage_id,
+            "p_contact_name": contact_name,
+            "p_contact_phone": contact_phone,
+            "p_value": value,
+            "p_metadata": metadata or {},
+        }).execute())
+        deal = result.data or None
         
         if deal:
-            # Log initial entry in history
-            await self._log_history(
-                deal_id=deal["id"],
-                from_stage=None,
-                to_stage=initial_stage_id,
-                triggered_by="system",
-                notes="Deal criado"
+            # Log initial entry in history and check for automation triggers.
+            # Independent for a new deal (it has no earlier history to find),
+            # so their round-trips overlap.
+            await asyncio.gather(
+                self._log_history(
+                    deal_id=deal["id"],
+                    from_stage=None,
+                    to_stage=initial_stage_id,
+                    triggered_by="system",
+                    notes="Deal criado"
+                ),
+                self._check_stage_automations(deal, None, initial_stage_id),
             )
             
-            # Check for automation triggers
-            await self._check_stage_automations(deal, None, initial_stage_id)
-            
-            logger.info("Deal created", deal_id=deal["id"], contact_id=contact_id, cycle=cycle_number)
+            logger.info("Deal created", deal_id=deal["id"], contact_id=contact_id, cycle=deal.get("cycle_number"))
         
         return deal
     
@@ -115,47 +133,35 @@ class DealManager:
         - Updates current_stage
         - Logs history with duration
         - Triggers automations if applicable
+        
+        The stage change, duration and history entry happen in one RPC.
         """
-        deal = await self.get_deal(deal_id)
-        if not deal:
+        result = await self._db(lambda: self.supabase.rpc("move_deal_tx", {
+            "p_deal_id": deal_id,
+            "p_target_stage": target_stage_id,
+            "p_triggered_by": triggered_by,
+            "p_triggered_by_id": triggered_by_id,
+            "p_triggered_by_name": triggered_by_name,
+            "p_notes": notes,
+        }).execute())
+        
+        move = result.data
+        if not move:
             logger.warning("Deal not found", deal_id=deal_id)
             return None
         
-        from_stage = deal.get("current_stage_id")
-        if from_stage == target_stage_id:
+        updated_deal = move["deal"]
+        from_stage = move["from_stage"]
+        if not move["moved"]:
             logger.info("Deal already in target stage", deal_id=deal_id, stage=target_stage_id)
-            return deal
-        
-        # Calculate duration in previous stage
-        duration = await self._calculate_stage_duration(deal_id, from_stage)
+            return updated_deal
         
-        # Update the deal
-        update_data = {
-            "current_stage_id": target_stage_id,
-            "updated_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        result = self.supabase.table("crm_deals").update(update_data).eq("id", deal_id).execute()
-        updated_deal = result.data[0] if result.data else None
-        
-        if updated_deal:
-            # Log history
-            await self._log_history(
-                deal_id=deal_id,
-                from_stage=from_stage,
-                to_stage=target_stage_id,
-                duration_in_stage=duration,
-                triggered_by=triggered_by,
-                triggered_by_id=triggered_by_id,
-                triggered_by_name=triggered_by_name,
-                notes=notes
-            )
-            
-            # Check for automation triggers
-            await self._check_stage_automations(updated_deal, from_stage, target_stage_id)
-            
-            logger.info("Deal moved", deal_id=deal_id, from_stage=from_stage, to_stage=target_stage_id)
+        # Check for automation triggers (journeys come back with the move)
+        await self._check_stage_automations(
+            updated_deal, from_stage, target_stage_id, journeys=move["journeys"]
+        )
         
+        logger.info("Deal moved", deal_id=deal_id, from_stage=from_stage, to_stage=target_stage_id)
         return updated_deal
     
     async def close_deal(
@@ -171,21 +177,29 @@ class DealManager:
         if status not in ("won", "lost"):
             raise ValueError("Status must be 'won' or 'lost'")
         
-        deal = await self.get_deal(deal_id)
+        deal = await self._get_deal_stage(deal_id)
         if not deal:
             return None
         
-        # Calculate final stage duration
-        duration = await self._calculate_stage_duration(deal_id, deal.get("current_stage_id"))
+        now = datetime.now(timezone.utc)
+        now_iso = now.isoformat()
+        
+        # Calculate final stage duration (history is only consulted for rows
+        # without a stage entry time)
+        entered_at = deal.get("stage_entered_at")
+        if entered_at:
+            duration = int((now - datetime.fromisoformat(entered_at)).total_seconds())
+        else:
+            duration = await self._calculate_stage_duration(deal_id, deal.get("current_stage_id"), now)
         
         # Update deal
         update_data = {
             "status": status,
-            "closed_at": datetime.now(timezone.utc).isoformat(),
-            "updated_at": datetime.now(timezone.utc).isoformat()
+            "closed_at": now_iso,
+            "updated_at": now_iso
         }
         
-        result = self.supabase.table("crm_deals").update(update_data).eq("id", deal_id).execute()
+        result = await self._db(lambda: self.supabase.table("crm_deals").update(update_data).eq("id", deal_id).execute())
         closed_deal = result.data[0] if result.data else None
         
         if closed_deal:
@@ -225,7 +239,7 @@ class DealManager:
     async def delete_deal(self, deal_id: str) -> bool:
         """Delete a deal and its history"""
         try:
-            self.supabase.table("crm_deals").delete().eq("id", deal_id).execute()
+            await self._db(lambda: self.supabase.table("crm_deals").delete().eq("id", deal_id).execute())
             logger.info("Deal deleted", deal_id=deal_id)
             return True
         except Exception as e:
@@ -255,18 +269,33 @@ class DealManager:
         if metadata is not None:
             update_data["metadata"] = metadata
         
-        result = self.supabase.table("crm_deals").update(update_data).eq("id", deal_id).execute()
+        result = await self._db(lambda: self.supabase.table("crm_deals").update(update_data).eq("id", deal_id).execute())
         return result.data[0] if result.data else None
     
     async def get_deal_history(self, deal_id: str) -> List[Dict[str, Any]]:
         """Get the movement history of a deal"""
-        result = self.supabase.table("crm_deal_history").select("*").eq("deal_id", deal_id).order("created_at", desc=True).execute()
+        result = await self._db(lambda: self.supabase.table("crm_deal_history").select("*").eq("deal_id", deal_id).order("created_at", desc=True).execute())
         return result.data or []
     
     # =========================================================================
     # PRIVATE HELPERS
     # =========================================================================
     
+    async def _db(self, query: Callable[[], Any]) -> Any:
+        """
+        Run a blocking Supabase call in a worker thread.
+        
+        The supabase-py client is synchronous; every call in this class goes
+        through here so none blocks the event loop, and independent calls
+        (see create_deal) overlap.
+        """
+        return await asyncio.to_thread(query)
+    
+    async def _get_deal_stage(self, deal_id: str) -> Optional[Dict[str, Any]]:
+        """Get only the identifying/stage columns of a deal (see get_deal for the full row)"""
+        result = await self._db(lambda: self.supabase.table("crm_deals").select("id,current_stage_id,contact_id,pipeline_id,stage_entered_at").eq("id", deal_id).single().execute())
+        return result.data if result.data else None
+    
     async def _log_history(
         self,
         deal_id: str,
@@ -292,16 +321,21 @@ class DealManager:
             "metadata": metadata or {}
         }
         
-        self.supabase.table("crm_deal_history").insert(history_data).execute()
+        await self._db(lambda: self.supabase.table("crm_deal_history").insert(history_data).execute())
     
-    async def _calculate_stage_duration(self, deal_id: str, stage_id: str) -> int:
+    async def _calculate_stage_duration(
+        self,
+        deal_id: str,
+        stage_id: str,
+        now: Optional[datetime] = None
+    ) -> int:
         """Calculate how long the deal was in the current stage (in seconds)"""
         # Get the last history entry for this stage
-        result = self.supabase.table("crm_deal_history").select("created_at").eq("deal_id", deal_id).eq("to_stage", stage_id).order("created_at", desc=True).limit(1).execute()
+        result = await self._db(lambda: self.supabase.table("crm_deal_history").select("created_at").eq("deal_id", deal_id).eq("to_stage", stage_id).order("created_at", desc=True).limit(1).execute())
         
         if result.data:
-            entry_time = datetime.fromisoformat(result.data[0]["created_at"].replace("Z", "+00:00"))
-            now = datetime.now(timezone.utc)
+            entry_time = datetime.fromisoformat(result.data[0]["created_at"])  # Parses "Z" on 3.11+
+            now = now or datetime.now(timezone.utc)
             return int((now - entry_time).total_seconds())
         return 0
     
@@ -309,53 +343,91 @@ class DealManager:
         self,
         deal: Dict[str, Any],
         from_stage: Optional[str],
-        to_stage: str
+        to_stage: str,
+        journeys: Optional[List[Dict[str, Any]]] = None
     ):
-        """Check if there are automations to trigger for this stage entry"""
-        # Get automations for pipeline_entry
-        result = self.supabase.table("automation_journeys").select("*").eq("trigger_type", "pipeline_entry").eq("is_active", True).execute()
-        
-        journeys = result.data or []
+        """
+        Check if there are automations to trigger for this stage entry.
+        `journeys` (already filtered to `to_stage`) skips the lookup when the
+        caller has them.
+        """
+        if journeys is None:
+            journeys = (await self._get_entry_journeys()).get(to_stage, ())
         
+        has_been = None  # Looked up once, only if a journey needs it
+        now = datetime.now(timezone.utc)  # One scheduling base for the whole batch
+        executions = []
         for journey in journeys:
-            trigger_config = journey.get("trigger_config", {})
-            if trigger_config.get("stage_id") == to_stage:
-                # Check if "only_first_time" is set
-                if trigger_config.get("only_first_time", False):
-                    # Check history if this deal has been in this stage before
+            # Check if "only_first_time" is set
+            if journey.get("trigger_config", {}).get("only_first_time", False):
+                # Check history if this deal has been in this stage before
+                if has_been is None:
                     has_been = await self._has_been_in_stage(deal["id"], to_stage)
-                    if has_been:
-                        continue  # Skip, not first time
-                
-                # Schedule automation execution
-                await self._schedule_automation(journey, deal)
+                if has_been:
+                    continue  # Skip, not first time
+            
+            executions.append(self._build_execution(journey, deal, now))
+        
+        # Schedule all automation executions in one insert
+        if executions:
+            await self._db(lambda: self.supabase.table("automation_executions").insert(executions).execute())
+            for execution in executions:
+                logger.info(
+                    "Automation scheduled",
+                    journey_id=execution["journey_id"],
+                    deal_id=execution["deal_id"],
+                    scheduled_at=execution["scheduled_at"]
+                )
+    
+    async def _get_entry_journeys(self) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Active pipeline_entry journeys of the tenant indexed by their trigger
+        stage_id, cached for JOURNEY_CACHE_TTL_SECONDS
+        """
+        cached = _JOURNEY_CACHE.get(self.tenant_id)
+        if cached and time.monotonic() - cached[0] < JOURNEY_CACHE_TTL_SECONDS:
+            return cached[1]
+        
+        result = await self._db(
+            lambda: self.supabase.table("automation_journeys").select("*").eq("trigger_type", "pipeline_entry").eq("is_active", True).execute()
+        )
+        by_stage: Dict[str, List[Dict[str, Any]]] = {}
+        for journey in result.data or []:
+            stage_id = (journey.get("trigger_config") or {}).get("stage_id")
+            by_stage.setdefault(stage_id, []).append(journey)
+        _JOURNEY_CACHE[self.tenant_id] = (time.monotonic(), by_stage)
+        return by_stage
     
     async def _has_been_in_stage(self, deal_id: str, stage_id: str) -> bool:
         """Check if deal has been in this stage before (excluding current entry)"""
-        result = self.supabase.table("crm_deal_history").select("id").eq("deal_id", deal_id).eq("to_stage", stage_id).execute()
-        # More than 1 means it's been there before (current entry is already logged)
+        # Two rows are enough to tell (current entry is already logged)
+        result = await self._db(
+            lambda: self.supabase.table("crm_deal_history").select("id").eq("deal_id", deal_id).eq("to_stage", stage_id).limit(2).execute()
+        )
+        # More than 1 means it's been there before
         return len(result.data or []) > 1
     
-    async def _schedule_automation(self, journey: Dict[str, Any], deal: Dict[str, Any]):
-        """Schedule an automation execution"""
+    def _build_execution(
+        self,
+        journey: Dict[str, Any],
+        deal: Dict[str, Any],
+        now: datetime
+    ) -> Dict[str, Any]:
+        """Build the automation_executions row for a journey triggered by a deal"""
         delay_config = journey.get("delay_config", {})
         delay_seconds = self._calculate_delay_seconds(delay_config)
         
-        scheduled_at = datetime.now(timezone.utc)
+        scheduled_at = now
         if delay_seconds > 0:
-            from datetime import timedelta
             scheduled_at += timedelta(seconds=delay_seconds)
         
-        execution_data = {
+        return {
             "journey_id": journey["id"],
             "deal_id": deal["id"],
             "contact_id": deal.get("contact_id"),
             "scheduled_at": scheduled_at.isoformat(),
             "status": "pending"
         }
-        
-        self.supabase.table("automation_executions").insert(execution_data).execute()
-        logger.info("Automation scheduled", journey_id=journey["id"], deal_id=deal["id"], scheduled_at=scheduled_at)
     
     def _calculate_delay_seconds(self, delay_config: Dict) -> int:
         """Convert delay config to seconds"""
@@ -12,8 +12,9 @@ Supports:
 - UAZAPI (Coming soon)
 """
 
+import logging
 from abc import ABC, abstractmethod
-from typing import Optional, List, Any, Type
+from typing import Dict, Optional, List, Any, Tuple, Type
 from enum import Enum
 import structlog
 
@@ -27,6 +28,9 @@ from app.schemas.whatsapp import (
 
 logger = structlog.get_logger()
 
+# Level check without building a structlog event (structlog uses stdlib loggers)
+_std_logger = logging.getLogger(__name__)
+
 
 class GatewayProvider(str, Enum):
     """Supported WhatsApp gateway providers"""
@@ -55,6 +59,114 @@ class BaseGatewayAdapter(ABC):
     def is_message_event(self, payload: dict) -> bool:
         """Check if this is a new message event (vs status update, etc)"""
         pass
+    
+    def dispatch(self, payload: dict) -> Tuple[bool, List[StandardMessage]]:
+        """
+        Classify and parse a payload in one call.
+        Returns (is_message_event, messages); messages is empty for other events.
+        """
+        if not self.is_message_event(payload):
+            return False, []
+        return True, self.parse_messages(payload)
+
+
+_EVOLUTION_CONTENT_FIELDS = (
+    "conversation", "extendedTextMessage", "audioMessage",
+    "imageMessage", "videoMessage", "documentMessage",
+)
+
+
+def _parse_evolution_fast(payload: dict) -> Optional[List[StandardMessage]]:
+    """
+    Build the same result as the EvolutionWebhookPayload path straight from
+    the dict, for payloads whose fields already have their exact types.
+    
+    Returns None when anything would need Pydantic's validation or coercion,
+    so the caller falls back to the validating path.
+    """
+    # Exact type() checks on purpose (noqa: E721 below): isinstance would let
+    # bool pass as int and str/dict subclasses through, which Pydantic coerces
+    event = payload["event"]
+    instance = payload["instance"]
+    data = payload.get("data")
+    if type(event) is not str or type(instance) is not str:  # noqa: E721
+        return None
+    if data is None:
+        return []
+    if type(data) is not dict:  # noqa: E721
+        return None
+    
+    key = data["key"]
+    remote_jid = key["remoteJid"]
+    message_id = key["id"]
+    from_me = key.get("fromMe", False)
+    if type(remote_jid) is not str or type(message_id) is not str or type(from_me) is not bool:  # noqa: E721
+        return None
+    
+    push_name = data.get("pushName")
+    message_type = data.get("messageType")
+    message_timestamp = data.get("messageTimestamp")
+    if push_name is not None and type(push_name) is not str:  # noqa: E721
+        return None
+    if message_type is not None and type(message_type) is not str:  # noqa: E721
+        return None
+    if message_timestamp is not None and type(message_timestamp) is not int:  # noqa: E721
+        return None
+    
+    msg = data.get("message")
+    if msg is not None:
+        if type(msg) is not dict:  # noqa: E721
+            return None
+        msg = {field: msg.get(field) for field in _EVOLUTION_CONTENT_FIELDS}
+        conversation = msg["conversation"]
+        if conversation is not None and type(conversation) is not str:  # noqa: E721
+            return None
+        for field in _EVOLUTION_CONTENT_FIELDS[1:]:
+            if msg[field] is not None and type(msg[field]) is not dict:  # noqa: E721
+                return None
+    
+    if from_me:
+        return []
+    
+    content = ""
+    content_type = "text"
+    media_url = None
+    
+    if msg:
+        if msg["conversation"]:
+            content = msg["conversation"]
+        elif msg["extendedTextMessage"]:
+            content = msg["extendedTextMessage"].get("text", "")
+        elif msg["audioMessage"]:
+            content_type = "audio"
+            media_url = msg["audioMessage"].get("url")
+        elif msg["imageMessage"]:
+            content_type = "image"
+            content = msg["imageMessage"].get("caption", "")
+            media_url = msg["imageMessage"].get("url")
+    
+    raw_payload = {
+        "event": event,
+        "instance": instance,
+        "data": {
+            "key": {"remoteJid": remote_jid, "fromMe": from_me, "id": message_id},
+            "pushName": push_name,
+            "message": msg,
+            "messageType": message_type,
+            "messageTimestamp": message_timestamp,
+        },
+    }
+    
+    return [StandardMessage(
+        message_id=message_id,
+        chat_id=remote_jid,
+        phone=remote_jid.split("@")[0],
+        content=content,
+        content_type=content_type,
+        media_url=media_url,
+        is_from_me=False,
+        raw_payload=raw_payload
+    )]
 
 
 class EvolutionAdapter(BaseGatewayAdapter):
@@ -67,11 +179,14 @@ class EvolutionAdapter(BaseGatewayAdapter):
     
     def is_message_event(self, payload: dict) -> bool:
         event = payload.get("event", "")
-        return event in ["messages.upsert", "message"]
+        return event in {"messages.upsert", "message"}
     
     def parse_messages(self, payload: dict) -> List[StandardMessage]:
         try:
-            parsed = EvolutionWebhookPayload(**payload)
+            messages = _parse_evolution_fast(payload)
+            if messages is not None:
+                return messages
+            parsed = EvolutionWebhookPayload.model_validate(payload)
             msg = parsed.to_standard_message()
             return [msg] if msg and not msg.is_from_me else []
         except Exception as e:
@@ -93,13 +208,23 @@ class ZAPIAdapter(BaseGatewayAdapter):
     
     def parse_messages(self, payload: dict) -> List[StandardMessage]:
         try:
-            parsed = ZAPIWebhookPayload(**payload)
+            parsed = ZAPIWebhookPayload.model_validate(payload)
             if parsed.fromMe:
                 return []
             return [parsed.to_standard_message()]
         except Exception as e:
             logger.error("Z-API parse error", error=str(e), payload=payload)
             return []
+    
+    def dispatch(self, payload: dict) -> Tuple[bool, List[StandardMessage]]:
+        # fromMe was already rejected by is_message_event, skip re-checking it
+        if not self.is_message_event(payload):
+            return False, []
+        try:
+            return True, [ZAPIWebhookPayload.model_validate(payload).to_standard_message()]
+        except Exception as e:
+            logger.error("Z-API parse error", error=str(e), payload=payload)
+            return True, []
 
 
 class MetaCloudAdapter(BaseGatewayAdapter):
@@ -112,17 +237,17 @@ class MetaCloudAdapter(BaseGatewayAdapter):
     
     def is_message_event(self, payload: dict) -> bool:
         try:
-            for entry in payload.get("entry", []):
-                for change in entry.get("changes", []):
-                    if change.get("value", {}).get("messages"):
-                        return True
-        except:
-            pass
-        return False
+            return any(
+                change.get("value", {}).get("messages")
+                for entry in payload.get("entry", ())
+                for change in entry.get("changes", ())
+            )
+        except (AttributeError, TypeError):  # Malformed entry/changes structure
+            return False
     
     def parse_messages(self, payload: dict) -> List[StandardMessage]:
         try:
-            parsed = MetaCloudWebhookPayload(**payload)
+            parsed = MetaCloudWebhookPayload.model_validate(payload)
             return parsed.to_standard_messages()
         except Exception as e:
             logger.error("Meta Cloud parse error", error=str(e), payload=payload)
@@ -142,31 +267,28 @@ class UAZAPIAdapter(BaseGatewayAdapter):
         - With 'instanceId' or 'instance' for instance identification
         - Direct message fields like 'phone', 'chatId', 'messageId'
         """
-        # Check for UAZAPI-specific fields
-        has_instance = "instanceId" in payload or "instance" in payload
+        # Check for UAZAPI-specific fields (plain `in` probes, each evaluated
+        # at most once and only when the result still depends on it)
         has_message_fields = "phone" in payload or "chatId" in payload
-        has_event = "event" in payload
         
         # UAZAPI typically has instance + event or direct message fields
-        if has_instance and (has_event or has_message_fields):
-            return True
+        if "instanceId" in payload or "instance" in payload:
+            if has_message_fields or "event" in payload:
+                return True
         
         # Also check for nested message structure with from/to
-        if has_message_fields and ("messageId" in payload or "message" in payload):
-            return True
-            
-        return False
+        return has_message_fields and ("messageId" in payload or "message" in payload)
     
     def is_message_event(self, payload: dict) -> bool:
         """Check if this is a new message event"""
         event = payload.get("event", "")
         
         # Skip status updates and connection events
-        if event in ["status", "connection.update", "qrcode", "messages.update"]:
+        if event in {"status", "connection.update", "qrcode", "messages.update"}:
             return False
         
         # Accept message events
-        if event in ["messages", "messages.upsert", "message", "received"]:
+        if event in {"messages", "messages.upsert", "message", "received"}:
             return True
         
         # If no event field, check for message content
@@ -179,7 +301,7 @@ class UAZAPIAdapter(BaseGatewayAdapter):
     
     def parse_messages(self, payload: dict) -> List[StandardMessage]:
         try:
-            parsed = UAZAPIWebhookPayload(**payload)
+            parsed = UAZAPIWebhookPayload.model_validate(payload)
             msg = parsed.to_standard_message()
             return [msg] if msg else []
         except Exception as e:
@@ -199,22 +321,39 @@ class GatewayAdapterFactory:
         MetaCloudAdapter(),
         UAZAPIAdapter(),
     ]
+    _adapters_by_provider: Dict[GatewayProvider, BaseGatewayAdapter] = {
+        adapter.provider: adapter for adapter in _adapters
+    }
     
     @classmethod
     def get_adapter(cls, provider: str) -> Optional[BaseGatewayAdapter]:
         """Get adapter by provider name"""
-        for adapter in cls._adapters:
-            if adapter.provider.value == provider.lower():
-                return adapter
+        try:
+            return cls._adapters_by_provider[GatewayProvider(provider.lower())]
+        except ValueError:
+            return None
+    
+    @classmethod
+    def _discriminate(cls, payload: dict) -> Optional[GatewayProvider]:
+        """
+        Identify the provider from its discriminator fields, in the same
+        precedence as the adapters' validate_payload checks.
+        """
+        if "event" in payload and "instance" in payload:
+            return GatewayProvider.EVOLUTION
+        if "phone" in payload and "messageId" in payload:
+            return GatewayProvider.ZAPI
+        if payload.get("object") == "whatsapp_business_account":
+            return GatewayProvider.META_CLOUD
+        if cls._adapters_by_provider[GatewayProvider.UAZAPI].validate_payload(payload):
+            return GatewayProvider.UAZAPI
         return None
     
     @classmethod
     def detect_and_get_adapter(cls, payload: dict) -> Optional[BaseGatewayAdapter]:
         """Auto-detect provider from payload and return appropriate adapter"""
-        for adapter in cls._adapters:
-            if adapter.validate_payload(payload):
-                return adapter
-        return None
+        provider = cls._discriminate(payload)
+        return cls._adapters_by_provider[provider] if provider else None
     
     @classmethod
     def parse_webhook(
@@ -237,17 +376,19 @@ class GatewayAdapterFactory:
             logger.warning("No matching adapter found", payload_keys=list(payload.keys()))
             return []
         
-        if not adapter.is_message_event(payload):
-            logger.debug("Not a message event", provider=adapter.provider.value)
-            return []
-        
-        messages = adapter.parse_messages(payload)
+        is_message, messages = adapter.dispatch(payload)
         
-        logger.info(
-            "Webhook parsed",
-            provider=adapter.provider.value,
-            message_count=len(messages)
-        )
+        # Per-webhook traces are debug-only (the webhook route logs processed
+        # messages); skip building the events entirely when debug is off
+        if _std_logger.isEnabledFor(logging.DEBUG):
+            if not is_message:
+                logger.debug("Not a message event", provider=adapter.provider.value)
+            else:
+                logger.debug(
+                    "Webhook parsed",
+                    provider=adapter.provider.value,
+                    message_count=len(messages)
+                )
         
         return messages
 
@@ -12,21 +12,27 @@ Maximum delay: 50 seconds (configurable).
 """
 
 import asyncio
+import itertools
 import random
+import time
 from typing import Optional, Callable, Any
-from dataclasses import dataclass
+from collections import defaultdict
+from dataclasses import dataclass, field
 from enum import Enum
 import structlog
 
 logger = structlog.get_logger()
 
+# Source of generated delay IDs (unique for the process lifetime)
+_delay_ids = itertools.count()
+
 
 class DelayStrategy(str, Enum):
     """Strategies for calculating delay duration."""
     FIXED = "fixed"           # Exactly the specified duration
     RANDOM_RANGE = "random"   # Random between min and max
     PROGRESSIVE = "progressive"  # Increases with each call
-    ADAPTIVE = "adaptive"     # Based on external signals (rate limits)
+    ADAPTIVE = "adaptive"     # Backs off on rate limits, recovers on success (AIMD)
 
 
 @dataclass
@@ -36,6 +42,10 @@ class DelayConfig:
     max_seconds: float = 50.0
     strategy: DelayStrategy = DelayStrategy.RANDOM_RANGE
     jitter_percent: float = 10.0  # Add randomness to fixed delays
+    jitter_ratio: float = field(init=False, repr=False)
+    
+    def __post_init__(self):
+        self.jitter_ratio = self.jitter_percent / 100
     
     def validate(self) -> bool:
         """Validate configuration."""
@@ -80,17 +90,27 @@ class IntelligentDelayService:
                 min_seconds=20,
                 max_seconds=50,
                 strategy=DelayStrategy.PROGRESSIVE,
-                delay_id=f"batch_{i}"
+                delay_id=f"batch_{i}",
+                progressive_key="batch"
             )
     """
     
     MAX_DELAY_SECONDS = 50.0  # Hard limit as per requirement
     
+    # ADAPTIVE multiplier bounds and AIMD steps: double on a rate limit,
+    # step back down by 0.1 per success
+    MIN_RATE_LIMIT_SIGNAL = 0.5
+    MAX_RATE_LIMIT_SIGNAL = 5.0
+    RATE_LIMIT_BACKOFF_FACTOR = 2.0
+    RATE_LIMIT_RECOVERY_STEP = 0.1
+    
     def __init__(self, default_config: Optional[DelayConfig] = None):
         self.default_config = default_config or DelayConfig()
         self._active_delays: dict[str, asyncio.Task] = {}
-        self._progressive_counter: dict[str, int] = {}
+        self._progressive_counter: defaultdict[str, int] = defaultdict(int)
         self._rate_limit_signals: dict[str, float] = {}
+        self._rate_limit_deadlines: dict[str, float] = {}  # key -> monotonic
+        self._rng = random.Random()
     
     async def delay(
         self,
@@ -98,6 +118,7 @@ class IntelligentDelayService:
         max_seconds: float = None,
         strategy: DelayStrategy = None,
         delay_id: str = None,
+        progressive_key: str = None,
     ) -> DelayResult:
         """
         Execute delay and return result.
@@ -107,6 +128,8 @@ class IntelligentDelayService:
             max_seconds: Maximum delay (capped at 50s)
             strategy: Delay calculation strategy
             delay_id: Optional ID for tracking/cancellation
+            progressive_key: Counter key for PROGRESSIVE delays (defaults
+                to delay_id without its last "_" segment)
             
         Returns:
             DelayResult with actual duration and metadata
@@ -120,10 +143,10 @@ class IntelligentDelayService:
         
         # Generate delay_id if not provided
         if not delay_id:
-            delay_id = f"delay_{id(asyncio.current_task())}_{random.randint(1000, 9999)}"
+            delay_id = f"delay_{next(_delay_ids)}"
         
         # Calculate delay based on strategy
-        delay_seconds = self._calculate_delay(min_s, max_s, strat, delay_id)
+        delay_seconds = self._calculate_delay(min_s, max_s, strat, delay_id, progressive_key)
         
         logger.debug(
             "Delay started",
@@ -154,8 +177,9 @@ class IntelligentDelayService:
                 was_cancelled=True
             )
         finally:
-            if delay_id and delay_id in self._active_delays:
-                del self._active_delays[delay_id]
+            # The tracked task is the caller's, which outlives the delay:
+            # untrack it here so cancel_delay cannot hit later work
+            self._active_delays.pop(delay_id, None)
     
     async def delay_then(
         self,
@@ -164,6 +188,7 @@ class IntelligentDelayService:
         max_seconds: float = None,
         strategy: DelayStrategy = None,
         delay_id: str = None,
+        progressive_key: str = None,
         **callback_kwargs
     ) -> Any:
         """
@@ -176,7 +201,7 @@ class IntelligentDelayService:
         Returns:
             Result of the callback function
         """
-        result = await self.delay(min_seconds, max_seconds, strategy, delay_id)
+        result = await self.delay(min_seconds, max_seconds, strategy, delay_id, progressive_key)
         
         if result.was_cancelled:
             return None
@@ -192,22 +217,26 @@ class IntelligentDelayService:
         min_s: float,
         max_s: float,
         strategy: DelayStrategy,
-        delay_id: str
+        delay_id: str,
+        progressive_key: Optional[str] = None
     ) -> float:
         """Calculate delay duration based on strategy."""
+        rand = self._rng.random
+        
         if strategy == DelayStrategy.FIXED:
             base = min_s
-            jitter = base * (self.default_config.jitter_percent / 100)
-            return max(0, base + random.uniform(-jitter, jitter))
+            jitter = base * self.default_config.jitter_ratio
+            return max(0.0, base + (2 * rand() - 1) * jitter)
         
         elif strategy == DelayStrategy.RANDOM_RANGE:
-            return random.uniform(min_s, max_s)
+            return min_s + (max_s - min_s) * rand()
         
         elif strategy == DelayStrategy.PROGRESSIVE:
-            # Increase delay with each call for same prefix
-            prefix = delay_id.rsplit("_", 1)[0] if "_" in delay_id else delay_id
-            count = self._progressive_counter.get(prefix, 0)
-            self._progressive_counter[prefix] = count + 1
+            # Increase delay with each call for same key
+            if progressive_key is None:
+                progressive_key = delay_id.rsplit("_", 1)[0]
+            count = self._progressive_counter[progressive_key]
+            self._progressive_counter[progressive_key] = count + 1
             
             # Progressive increase: start at min, approach max
             progress = min(count / 10, 1.0)  # Reaches max after 10 calls
@@ -215,25 +244,33 @@ class IntelligentDelayService:
             
             # Add small jitter
             jitter = base * 0.1
-            return min(base + random.uniform(-jitter, jitter), max_s)
+            return min(base + (2 * rand() - 1) * jitter, max_s)
         
         elif strategy == DelayStrategy.ADAPTIVE:
             # Check for rate limit signals
             signal = self._rate_limit_signals.get(delay_id, 1.0)
             
             # Multiply delay by signal (1.0 = normal, 2.0 = double delay)
-            base = random.uniform(min_s, max_s)
-            return min(base * signal, max_s)
+            base = min_s + (max_s - min_s) * rand()
+            base = min(base * signal, max_s)
+            
+            # Never fire before a provider's Retry-After has passed
+            deadline = self._rate_limit_deadlines.get(delay_id)
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait > 0:
+                    return max(base, min(wait, self.MAX_DELAY_SECONDS))
+                del self._rate_limit_deadlines[delay_id]
+            return base
         
-        return random.uniform(min_s, max_s)
+        return min_s + (max_s - min_s) * rand()
     
     async def cancel_delay(self, delay_id: str) -> bool:
         """Cancel an active delay by ID."""
-        if delay_id in self._active_delays:
-            task = self._active_delays[delay_id]
+        task = self._active_delays.pop(delay_id, None)
+        if task is not None:
             if not task.done():
                 task.cancel()
-            del self._active_delays[delay_id]
             logger.info("Delay cancelled", delay_id=delay_id)
             return True
         return False
@@ -250,7 +287,31 @@ class IntelligentDelayService:
             key: Identifier for the rate limit context
             multiplier: Delay multiplier (1.0 = normal, 2.0 = double)
         """
-        self._rate_limit_signals[key] = max(0.5, min(multiplier, 5.0))
+        self._rate_limit_signals[key] = max(
+            self.MIN_RATE_LIMIT_SIGNAL, min(multiplier, self.MAX_RATE_LIMIT_SIGNAL)
+        )
+    
+    def record_rate_limited(self, key: str, retry_after: Optional[float] = None):
+        """
+        Back off adaptive delays for a key after a rate limit (e.g. a 429).
+        
+        Doubles the key's multiplier and, when the provider sent a
+        Retry-After, holds its delays until that moment.
+        
+        Args:
+            key: Identifier for the rate limit context
+            retry_after: Seconds the provider asked to wait
+        """
+        signal = self._rate_limit_signals.get(key, 1.0)
+        self.set_rate_limit_signal(key, signal * self.RATE_LIMIT_BACKOFF_FACTOR)
+        if retry_after:
+            self._rate_limit_deadlines[key] = time.monotonic() + retry_after
+    
+    def record_success(self, key: str):
+        """Relax adaptive delays for a key after a successful send."""
+        signal = self._rate_limit_signals.get(key)
+        if signal is not None:
+            self.set_rate_limit_signal(key, signal - self.RATE_LIMIT_RECOVERY_STEP)
     
     def reset_progressive_counter(self, prefix: str = None):
         """Reset progressive delay counters."""
@@ -303,7 +364,8 @@ async def campaign_delay(
         min_seconds=min_seconds,
         max_seconds=max_seconds,
         strategy=DelayStrategy.PROGRESSIVE,
-        delay_id=f"campaign_batch_{batch_index}"
+        delay_id=f"campaign_batch_{batch_index}",
+        progressive_key="campaign_batch"
     )
     
     logger.info(
@@ -318,30 +380,35 @@ async def campaign_delay(
 async def reengagement_delay(
     conversation_id: str,
     attempt: int = 1,
-    base_delay_seconds: float = 120
+    base_delay_seconds: float = 5,
+    retry_after: Optional[float] = None
 ) -> float:
     """
     Delay for reengagement attempts.
     
-    Uses adaptive strategy that increases with each attempt.
+    Exponential backoff with full jitter: the ceiling doubles with each
+    attempt (capped at 50s) and the delay is drawn uniformly below it, so
+    retries after a rate limit spread out instead of firing together.
     
     Args:
         conversation_id: Conversation being reengaged
         attempt: Attempt number (1, 2, 3, ...)
-        base_delay_seconds: Base delay for first attempt
+        base_delay_seconds: Backoff ceiling for the first attempt
+        retry_after: Minimum wait requested by the provider (Retry-After)
         
     Returns:
         Actual delay duration in seconds
     """
     service = get_delay_service()
     
-    # Progressive delay: 2min, 4min, 8min (capped at 50s for this service)
-    # Note: For longer delays, use external scheduler
-    delay = min(base_delay_seconds * (2 ** (attempt - 1)), 50)
+    # Ceilings 5s, 10s, 20s, 40s, 50s...; for longer delays, use an
+    # external scheduler
+    ceiling = min(base_delay_seconds * (2 ** (attempt - 1)), service.MAX_DELAY_SECONDS)
+    floor = min(retry_after or 0, service.MAX_DELAY_SECONDS)
     
     result = await service.delay(
-        min_seconds=delay * 0.8,
-        max_seconds=delay,
+        min_seconds=floor,
+        max_seconds=max(ceiling, floor),
         strategy=DelayStrategy.RANDOM_RANGE,
         delay_id=f"reengagement_{conversation_id}_{attempt}"
     )
@@ -8,19 +8,26 @@ bots respond to each one separately.
 
 ARCHITECTURE:
 1. Webhook receives message → pushes to Redis buffer
-2. Each push resets TTL (e.g., 8 seconds)
-3. When TTL expires (user stopped typing), Redis publishes event
+2. Each push moves the chat's deadline (e.g., 8 seconds ahead) and
+   appends an event to a Redis Stream
+3. A watchdog consumer group reads the events; at an event's deadline,
+   if no newer push moved it (user stopped typing), the buffer is drained
 4. Worker consumes the "packet" of accumulated messages
 5. Entire packet is sent to AI as single context
 
-This uses Redis EXPIRE + Pub/Sub for reliable event-driven processing.
+This uses a Redis Streams consumer group for reliable, at-least-once
+event-driven processing that scales across worker processes.
 """
 
-import json
 import asyncio
+import os
+import socket
+import time
 from datetime import datetime, timedelta
-from typing import Optional, List, Callable, Awaitable
+from typing import Optional, List, Set, Callable, Awaitable
+import orjson
 import structlog
+from redis.exceptions import ResponseError
 
 from app.db.redis import get_redis, RedisClient
 from app.schemas.whatsapp import StandardMessage, BufferedMessagePacket
@@ -30,8 +37,26 @@ logger = structlog.get_logger()
 
 # Buffer configuration
 BUFFER_TTL_SECONDS = 8  # Wait 8 seconds of silence before processing
-BUFFER_KEY_PREFIX = "buffer:chat:"
+BUFFER_KEY_PREFIX = "buffer:zchat:"  # Sorted sets; "buffer:chat:" held the old lists
 BUFFER_CHANNEL = "buffer:expired"
+BUFFER_RETENTION_SECONDS = 300  # Safety TTL for buffers nobody drained
+MAX_BUFFER_SIZE = 64  # Oldest messages are dropped past this (flood guard)
+
+# Buffer events stream, consumed by BufferWatchdog's consumer group
+BUFFER_STREAM = "buffer:events"
+BUFFER_GROUP = "buffer_workers"
+BUFFER_STREAM_MAXLEN = 10000
+BUFFER_READ_COUNT = 64
+BUFFER_READ_BLOCK_MS = 1000
+BUFFER_CLAIM_IDLE_MS = 60_000  # Events a dead consumer left unacked
+BUFFER_CLAIM_INTERVAL_SECONDS = 30
+
+# KEYS[1] = buffer, KEYS[2] = lock: return the messages, drop both keys
+_DRAIN_SCRIPT = """
+local messages = redis.call('ZRANGE', KEYS[1], 0, -1)
+redis.call('DEL', KEYS[1], KEYS[2])
+return messages
+"""
 
 
 class MessageBufferService:
@@ -46,6 +71,7 @@ class MessageBufferService:
         self._redis_client = None
         self._handlers: List[Callable[[BufferedMessagePacket], Awaitable[None]]] = []
         self._available = True
+        self._drain_script = None
     
     async def _get_redis_client(self):
         """Get Redis client (async). Returns None if not available."""
@@ -67,13 +93,17 @@ class MessageBufferService:
         """Generate Redis key for processing lock"""
         return f"lock:buffer:{tenant_id}:{chat_id}"
     
+    def _get_deadline_key(self, tenant_id: str, chat_id: str) -> str:
+        """Generate Redis key for the buffer's processing deadline"""
+        return f"buffer:deadline:{tenant_id}:{chat_id}"
+    
     async def push_message(
         self, 
         tenant_id: str, 
         message: StandardMessage
     ) -> int:
         """
-        Push a message to the buffer and reset TTL.
+        Push a message to the buffer and reset its deadline.
         
         Returns the current message count in buffer. Returns 0 if Redis unavailable.
         """
@@ -83,6 +113,7 @@ class MessageBufferService:
             return 0
         
         key = self._get_buffer_key(tenant_id, message.chat_id)
+        deadline_key = self._get_deadline_key(tenant_id, message.chat_id)
         
         # Message data to store
         message_data = {
@@ -95,19 +126,39 @@ class MessageBufferService:
             "media_mime_type": message.media_mime_type,
             "media_duration_seconds": message.media_duration_seconds,
             "is_from_me": message.is_from_me,
-            "timestamp": message.timestamp.isoformat(),
+            "timestamp": message.timestamp,  # orjson writes ISO 8601
             "tenant_id": tenant_id,
         }
         
         try:
-            # Add message to list
-            await redis.rpush(key, json.dumps(message_data))
-            
-            # Reset TTL - this is the core of anti-picote
-            await redis.expire(key, BUFFER_TTL_SECONDS)
+            # Add message to the buffer and push the deadline forward - this
+            # is the core of anti-picote. One MULTI round-trip, so the
+            # buffer, its deadline and the watchdog event are written
+            # together. The buffer is a sorted set scored by arrival time,
+            # trimmed to the newest MAX_BUFFER_SIZE messages.
+            now = time.time()
+            deadline = f"{now + BUFFER_TTL_SECONDS:.3f}"
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.zadd(key, {orjson.dumps(message_data): now})
+                pipe.zremrangebyrank(key, 0, -MAX_BUFFER_SIZE - 1)
+                pipe.zcard(key)
+                pipe.expire(key, BUFFER_RETENTION_SECONDS)
+                pipe.set(deadline_key, deadline, ex=BUFFER_RETENTION_SECONDS)
+                pipe.xadd(
+                    BUFFER_STREAM,
+                    {"tenant_id": tenant_id, "chat_id": message.chat_id, "deadline": deadline},
+                    maxlen=BUFFER_STREAM_MAXLEN,
+                    approximate=True,
+                )
+                _, dropped, count, *_ = await pipe.execute()
             
-            # Get current count
-            count = await redis.llen(key)
+            if dropped:
+                logger.warning(
+                    "Buffer full, oldest messages dropped",
+                    tenant_id=tenant_id,
+                    chat_id=message.chat_id,
+                    dropped=dropped
+                )
             
             logger.info(
                 "Message buffered",
@@ -144,67 +195,46 @@ class MessageBufferService:
                 logger.debug("Buffer already being processed", chat_id=chat_id)
                 return None
             
-            try:
-                # Get all messages atomically
-                messages_raw = await redis.lrange(key, 0, -1)
-                
-                if not messages_raw:
-                    return None
-                
-                # Delete the buffer
-                await redis.delete(key)
-                
-                # Parse messages
-                messages = []
-                phone = ""
-                first_timestamp = None
-                last_timestamp = None
-                total_duration = 0
-                
-                for raw in messages_raw:
-                    data = json.loads(raw)
-                    msg = StandardMessage(
-                        message_id=data["message_id"],
-                        chat_id=data["chat_id"],
-                        phone=data["phone"],
-                        content=data.get("content", ""),
-                        content_type=data.get("content_type", "text"),
-                        media_url=data.get("media_url"),
-                        media_mime_type=data.get("media_mime_type"),
-                        media_duration_seconds=data.get("media_duration_seconds"),
-                        is_from_me=data.get("is_from_me", False),
-                        timestamp=datetime.fromisoformat(data["timestamp"]),
-                    )
-                    messages.append(msg)
-                    
-                    if not phone:
-                        phone = msg.phone
-                    
-                    ts = msg.timestamp
-                    if first_timestamp is None or ts < first_timestamp:
-                        first_timestamp = ts
-                    if last_timestamp is None or ts > last_timestamp:
-                        last_timestamp = ts
-                    
-                    if msg.media_duration_seconds:
-                        total_duration += msg.media_duration_seconds
-                
-                if not messages:
-                    return None
-                
-                return BufferedMessagePacket(
-                    chat_id=messages[0].chat_id,
-                    tenant_id=tenant_id,
-                    phone=phone,
-                    messages=messages,
-                    total_duration_seconds=total_duration,
-                    first_message_at=first_timestamp or datetime.utcnow(),
-                    last_message_at=last_timestamp or datetime.utcnow(),
+            # Read the buffer, delete it and release the lock in one
+            # atomic round-trip
+            if self._drain_script is None:
+                self._drain_script = redis.register_script(_DRAIN_SCRIPT)
+            messages_raw = await self._drain_script(keys=[key, lock_key])
+            
+            if not messages_raw:
+                return None
+            
+            # Parse messages
+            messages = [
+                StandardMessage(
+                    message_id=data["message_id"],
+                    chat_id=data["chat_id"],
+                    phone=data["phone"],
+                    content=data.get("content", ""),
+                    content_type=data.get("content_type", "text"),
+                    media_url=data.get("media_url"),
+                    media_mime_type=data.get("media_mime_type"),
+                    media_duration_seconds=data.get("media_duration_seconds"),
+                    is_from_me=data.get("is_from_me", False),
+                    timestamp=datetime.fromisoformat(data["timestamp"]),
                 )
+                for data in map(orjson.loads, messages_raw)
+            ]
+            
+            timestamps = [msg.timestamp for msg in messages]
+            phone = next((msg.phone for msg in messages if msg.phone), "")
+            total_duration = sum(msg.media_duration_seconds or 0 for msg in messages)
+            
+            return BufferedMessagePacket(
+                chat_id=messages[0].chat_id,
+                tenant_id=tenant_id,
+                phone=phone,
+                messages=messages,
+                total_duration_seconds=total_duration,
+                first_message_at=min(timestamps),
+                last_message_at=max(timestamps),
+            )
             
-            finally:
-                # Release lock
-                await redis.delete(lock_key)
         except Exception as e:
             logger.error("Error getting buffer", error=str(e))
             return None
@@ -216,7 +246,7 @@ class MessageBufferService:
             return 0
         try:
             key = self._get_buffer_key(tenant_id, chat_id)
-            return await redis.llen(key)
+            return await redis.zcard(key)
         except Exception:
             return 0
     
@@ -240,30 +270,35 @@ class MessageBufferService:
         self._handlers.append(handler)
     
     async def _notify_handlers(self, packet: BufferedMessagePacket):
-        """Notify all registered handlers"""
-        for handler in self._handlers:
-            try:
-                await handler(packet)
-            except Exception as e:
+        """Notify all registered handlers concurrently"""
+        results = await asyncio.gather(
+            *(handler(packet) for handler in self._handlers),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
                 logger.error(
                     "Buffer handler error",
-                    error=str(e),
+                    error=str(result),
                     chat_id=packet.chat_id
                 )
 
 
 class BufferWatchdog:
     """
-    Background task that monitors for expired buffers.
-    Uses Redis keyspace notifications for efficiency.
+    Background task that processes buffers once their chat goes silent.
     
-    Alternative: Use Celery beat to poll for expired keys.
+    Consumes the buffer events stream through a consumer group, so every
+    worker process shares the load and an event a crashed consumer left
+    unacknowledged is claimed by another one (at-least-once delivery).
     """
     
     def __init__(self, buffer_service: MessageBufferService):
         self.buffer_service = buffer_service
         self._running = False
         self._task: Optional[asyncio.Task] = None
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._pending: Set[asyncio.Task] = set()
     
     async def start(self):
         """Start watching for expired buffers"""
@@ -277,6 +312,9 @@ class BufferWatchdog:
     async def stop(self):
         """Stop the watchdog"""
         self._running = False
+        # Unacked events of cancelled waits are claimed by another consumer
+        for task in list(self._pending):
+            task.cancel()
         if self._task:
             self._task.cancel()
             try:
@@ -286,13 +324,7 @@ class BufferWatchdog:
         logger.info("Buffer watchdog stopped")
     
     async def _watch_loop(self):
-        """
-        Main watch loop using Redis keyspace notifications.
-        
-        Requires Redis to be configured with:
-        notify-keyspace-events Ex
-        """
-        # Get Redis client
+        """Main watch loop: read buffer events and reclaim stale ones."""
         redis = await self.buffer_service._get_redis_client()
         
         if redis is None:
@@ -301,34 +333,62 @@ class BufferWatchdog:
             return
         
         try:
-            # Subscribe to expired key events
-            # Note: This requires Redis keyspace notifications enabled
-            pubsub = redis.pubsub()
-        
-            # Subscribe to expired events for our buffer keys
-            await pubsub.psubscribe("__keyevent@0__:expired")
+            try:
+                await redis.xgroup_create(BUFFER_STREAM, BUFFER_GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
             
-            async for message in pubsub.listen():
-                if not self._running:
-                    break
-                
-                if message["type"] != "pmessage":
-                    continue
-                
-                key = message.get("data", b"").decode() if message.get("data") else ""
-                
-                # Check if it's a buffer key
-                if not key.startswith(BUFFER_KEY_PREFIX):
-                    continue
-                
-                # Extract tenant_id and chat_id from key
-                # Format: buffer:chat:{tenant_id}:{chat_id}
-                parts = key.replace(BUFFER_KEY_PREFIX, "").split(":", 1)
-                if len(parts) != 2:
-                    continue
-                
-                tenant_id, chat_id = parts
+            last_claim = 0.0
+            while self._running:
+                now = time.monotonic()
+                if now - last_claim >= BUFFER_CLAIM_INTERVAL_SECONDS:
+                    last_claim = now
+                    claimed = await redis.xautoclaim(
+                        BUFFER_STREAM, BUFFER_GROUP, self._consumer,
+                        min_idle_time=BUFFER_CLAIM_IDLE_MS,
+                        count=BUFFER_READ_COUNT,
+                    )
+                    self._schedule(redis, claimed[1])
                 
+                response = await redis.xreadgroup(
+                    BUFFER_GROUP, self._consumer, {BUFFER_STREAM: ">"},
+                    count=BUFFER_READ_COUNT, block=BUFFER_READ_BLOCK_MS,
+                )
+                for _stream, entries in response or []:
+                    self._schedule(redis, entries)
+        
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error("Buffer watchdog error", error=str(e))
+    
+    def _schedule(self, redis, entries):
+        """Wait out each event's deadline concurrently"""
+        for entry_id, fields in entries:
+            if not fields:  # Trimmed from the stream while pending
+                continue
+            task = asyncio.create_task(self._process_event(redis, entry_id, fields))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+    
+    async def _process_event(self, redis, entry_id: str, fields: dict):
+        """
+        Drain the buffer at the event's deadline unless a newer push moved
+        the deadline (that push's own event takes over), then acknowledge.
+        """
+        try:
+            delay = float(fields["deadline"]) - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            tenant_id = fields["tenant_id"]
+            chat_id = fields["chat_id"]
+            current = await redis.get(
+                self.buffer_service._get_deadline_key(tenant_id, chat_id)
+            )
+            
+            if current is None or current == fields["deadline"]:
                 logger.info(
                     "Buffer expired, processing",
                     tenant_id=tenant_id,
@@ -339,16 +399,13 @@ class BufferWatchdog:
                 packet = await self.buffer_service.get_buffer(tenant_id, chat_id)
                 if packet:
                     await self.buffer_service._notify_handlers(packet)
-        
+            
+            await redis.xack(BUFFER_STREAM, BUFFER_GROUP, entry_id)
         except asyncio.CancelledError:
             pass
         except Exception as e:
-            logger.error("Buffer watchdog error", error=str(e))
-        finally:
-            try:
-                await pubsub.punsubscribe()
-            except Exception:
-                pass
+            # Left pending: another consumer claims and retries it
+            logger.error("Buffer watchdog error", error=str(e), entry_id=entry_id)
 
 
 # Singleton instance
@@ -22,7 +22,8 @@ Usage:
 """
 
 import re
-from typing import Optional, List
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import structlog
@@ -49,22 +50,22 @@ class SecurityCheckResult:
     details: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class GuardrailsConfig:
     """Configuration for guardrails from agent settings"""
     enabled: bool = False
     input_prompt: str = ""
     output_prompt: str = ""
-    blocked_patterns: List[str] = None
-    sensitive_patterns: List[str] = None
+    blocked_patterns: Optional[Sequence[str]] = None
+    sensitive_patterns: Optional[Sequence[str]] = None
     block_message: str = "Desculpe, não posso ajudar com esse tipo de solicitação."
     use_llm_validation: bool = True
     
     def __post_init__(self):
         if self.blocked_patterns is None:
-            self.blocked_patterns = DEFAULT_BLOCKED_PATTERNS
+            object.__setattr__(self, "blocked_patterns", DEFAULT_BLOCKED_PATTERNS)
         if self.sensitive_patterns is None:
-            self.sensitive_patterns = DEFAULT_SENSITIVE_PATTERNS
+            object.__setattr__(self, "sensitive_patterns", DEFAULT_SENSITIVE_PATTERNS)
 
 
 # ===========================================
@@ -159,6 +160,21 @@ Responda APENAS com uma palavra:
 Resposta:"""
 
 
+@lru_cache(maxsize=256)
+def _compile_patterns(patterns: Tuple[str, ...]) -> Tuple[Tuple[str, re.Pattern], ...]:
+    """
+    Compile a pattern list once and share it across checks and agents.
+    Invalid patterns are logged and skipped.
+    """
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append((pattern, re.compile(pattern, re.IGNORECASE)))
+        except re.error as e:
+            logger.error("Invalid regex pattern", pattern=pattern, error=str(e))
+    return tuple(compiled)
+
+
 class PromptSecurityService:
     """
     AI Guardrails - Prompt Injection & Data Leakage Protection
@@ -251,15 +267,8 @@ class PromptSecurityService:
         if not config.enabled:
             return SecurityCheckResult(blocked=False)
         
-        # Normalize for checking
-        normalized = response.lower().strip()
-        
         # Step 1: Pattern matching for sensitive data
-        pattern_result = self._check_patterns(
-            text=normalized,
-            patterns=config.sensitive_patterns or DEFAULT_SENSITIVE_PATTERNS,
-            reason=BlockReason.SENSITIVE_DATA
-        )
+        pattern_result = self.check_output_patterns(response, config)
         
         if pattern_result.blocked:
             logger.warning(
@@ -286,6 +295,21 @@ class PromptSecurityService:
         
         return SecurityCheckResult(blocked=False)
     
+    def check_output_patterns(
+        self,
+        response: str,
+        config: GuardrailsConfig
+    ) -> SecurityCheckResult:
+        """
+        Regex-only sensitive data check, cheap enough to run on a partial
+        response while it is still being generated.
+        """
+        return self._check_patterns(
+            text=response.lower().strip(),
+            patterns=config.sensitive_patterns or DEFAULT_SENSITIVE_PATTERNS,
+            reason=BlockReason.SENSITIVE_DATA
+        )
+    
     # ===========================================
     # HELPER METHODS
     # ===========================================
@@ -293,21 +317,17 @@ class PromptSecurityService:
     def _check_patterns(
         self, 
         text: str, 
-        patterns: List[str],
+        patterns: Sequence[str],
         reason: BlockReason = BlockReason.PATTERN_MATCH
     ) -> SecurityCheckResult:
         """Check text against a list of regex patterns"""
-        for pattern in patterns:
-            try:
-                if re.search(pattern, text, re.IGNORECASE):
-                    return SecurityCheckResult(
-                        blocked=True,
-                        reason=reason,
-                        matched_pattern=pattern
-                    )
-            except re.error as e:
-                logger.error("Invalid regex pattern", pattern=pattern, error=str(e))
-                continue
+        for pattern, regex in _compile_patterns(tuple(patterns)):
+            if regex.search(text):
+                return SecurityCheckResult(
+                    blocked=True,
+                    reason=reason,
+                    matched_pattern=pattern
+                )
         
         return SecurityCheckResult(blocked=False)
     
@@ -506,10 +506,15 @@ class RAGService:
         agent_id: Optional[str] = None,
         max_tokens: int = 2000,
         include_sources: bool = True,
+        stable_order: bool = False,
     ) -> Tuple[str, List[str]]:
         """
         Get formatted context for LLM prompt injection.
         
+        Chunks are selected by relevance either way; with `stable_order` the
+        selected chunks are emitted in content-hash order, so near-identical
+        queries produce byte-identical context and keep prompt caching warm.
+        
         Returns:
             Tuple of (formatted_context, source_titles)
         """
@@ -539,6 +544,9 @@ class RAGService:
         if not context_parts:
             return "", []
         
+        if stable_order:
+            context_parts.sort(key=lambda part: hashlib.sha1(part.encode()).digest())
+        
         formatted = "\n\n---\n\n".join(context_parts)
         return formatted, sources
     
@@ -0,0 +1,50 @@
+-- ============================================================================
+-- 029_ai_orchestrator_functions.sql
+-- Apollo Supabase (Master) - Server-side helpers for the AI orchestrator
+-- ============================================================================
+-- Collapses the orchestrator's multi-request write paths into single RPCs.
+
+-- ===========================================
+-- SAVE TURN
+-- Inserts the customer message and the AI reply and bumps the
+-- conversation counters in one transaction (one HTTP round-trip).
+-- ===========================================
+
+CREATE OR REPLACE FUNCTION save_turn(
+    p_conversation_id UUID,
+    p_tenant_id UUID,
+    p_user_message TEXT,
+    p_user_content_type VARCHAR DEFAULT 'text',
+    p_ai_response TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_user_message_id UUID;
+    v_ai_message_id UUID;
+BEGIN
+    INSERT INTO public.messages (conversation_id, tenant_id, sender_type, sender_name, content, content_type)
+    VALUES (p_conversation_id, p_tenant_id, 'customer', NULL, p_user_message, p_user_content_type)
+    RETURNING id INTO v_user_message_id;
+
+    INSERT INTO public.messages (conversation_id, tenant_id, sender_type, content, content_type)
+    VALUES (p_conversation_id, p_tenant_id, 'ai', p_ai_response, 'text')
+    RETURNING id INTO v_ai_message_id;
+
+    -- Denormalized counters: O(1) increments instead of COUNT(*) over messages
+    UPDATE public.conversations
+    SET message_count = COALESCE(message_count, 0) + 2,
+        ai_message_count = COALESCE(ai_message_count, 0) + 1,
+        last_message_at = NOW()
+    WHERE id = p_conversation_id;
+
+    RETURN jsonb_build_object(
+        'user_message_id', v_user_message_id,
+        'ai_message_id', v_ai_message_id
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION save_turn TO service_role;
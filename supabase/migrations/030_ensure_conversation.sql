@@ -0,0 +1,94 @@
+-- ============================================================================
+-- 030_ensure_conversation.sql
+-- Apollo Supabase (Master) - Conversation bootstrap for the AI orchestrator
+-- ============================================================================
+-- Resolves (or creates) the lead and the active conversation for an inbound
+-- WhatsApp number in one RPC instead of up to six sequential requests.
+
+-- ===========================================
+-- ENSURE CONVERSATION
+-- Returns the active conversation for tenant + phone with its agent embedded
+-- under "agent", creating the lead and conversation when needed. A
+-- transaction-scoped advisory lock per tenant/phone keeps concurrent
+-- messages from the same number from creating duplicates.
+-- ===========================================
+
+CREATE OR REPLACE FUNCTION ensure_conversation(
+    p_tenant_id UUID,
+    p_phone VARCHAR,
+    p_chat_id VARCHAR
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_conversation public.conversations%ROWTYPE;
+    v_lead_id UUID;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(p_tenant_id::TEXT || ':' || p_phone));
+
+    UPDATE public.conversations
+    SET last_message_at = NOW()
+    WHERE id = (
+        SELECT id FROM public.conversations
+        WHERE tenant_id = p_tenant_id
+          AND phone_number = p_phone
+          AND status = 'active'
+        LIMIT 1
+    )
+    RETURNING * INTO v_conversation;
+
+    IF v_conversation.id IS NULL THEN
+        UPDATE public.crm_leads
+        SET last_contact_at = NOW()
+        WHERE id = (
+            SELECT id FROM public.crm_leads
+            WHERE tenant_id = p_tenant_id
+              AND whatsapp = p_phone
+            LIMIT 1
+        )
+        RETURNING id INTO v_lead_id;
+
+        IF v_lead_id IS NULL THEN
+            INSERT INTO public.crm_leads (
+                tenant_id, pipeline_stage_id, whatsapp, phone, source, temperature, status
+            )
+            VALUES (
+                p_tenant_id,
+                (
+                    SELECT id FROM public.crm_pipeline_stages
+                    WHERE tenant_id = p_tenant_id
+                    ORDER BY position
+                    LIMIT 1
+                ),
+                p_phone, p_phone, 'whatsapp', 'warm', 'new'
+            )
+            RETURNING id INTO v_lead_id;
+        END IF;
+
+        INSERT INTO public.conversations (
+            tenant_id, agent_id, lead_id, external_id, channel, phone_number, status, mode
+        )
+        VALUES (
+            p_tenant_id,
+            (
+                SELECT id FROM public.agents
+                WHERE tenant_id = p_tenant_id
+                  AND is_default = true
+                  AND status = 'active'
+                LIMIT 1
+            ),
+            v_lead_id, p_chat_id, 'whatsapp', p_phone, 'active', 'ai'
+        )
+        RETURNING * INTO v_conversation;
+    END IF;
+
+    RETURN to_jsonb(v_conversation) || jsonb_build_object(
+        'agent',
+        (SELECT to_jsonb(a) FROM public.agents a WHERE a.id = v_conversation.agent_id)
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION ensure_conversation TO service_role;
@@ -0,0 +1,84 @@
+-- ============================================================================
+-- 031_conversation_history_version.sql
+-- Apollo Supabase (Master) - Change marker for conversation history
+-- ============================================================================
+-- Bumped whenever a conversation's visible history changes, whichever client
+-- writes it (AI workers, human agents, message deletion). The orchestrator
+-- reuses a cached context only while the version still matches the one its
+-- own save_turn produced.
+
+ALTER TABLE public.conversations
+    ADD COLUMN IF NOT EXISTS history_version BIGINT NOT NULL DEFAULT 0;
+
+-- ===========================================
+-- HISTORY VERSION TRIGGER
+-- ===========================================
+
+CREATE OR REPLACE FUNCTION bump_conversation_history_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE public.conversations
+    SET history_version = history_version + 1
+    WHERE id = NEW.conversation_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_messages_history_insert ON public.messages;
+CREATE TRIGGER trigger_messages_history_insert
+    AFTER INSERT ON public.messages
+    FOR EACH ROW EXECUTE FUNCTION bump_conversation_history_version();
+
+DROP TRIGGER IF EXISTS trigger_messages_history_update ON public.messages;
+CREATE TRIGGER trigger_messages_history_update
+    AFTER UPDATE OF is_deleted, content ON public.messages
+    FOR EACH ROW
+    WHEN (OLD.is_deleted IS DISTINCT FROM NEW.is_deleted OR OLD.content IS DISTINCT FROM NEW.content)
+    EXECUTE FUNCTION bump_conversation_history_version();
+
+-- ===========================================
+-- SAVE TURN
+-- Same as 029, also returning the history version after the turn
+-- ===========================================
+
+CREATE OR REPLACE FUNCTION save_turn(
+    p_conversation_id UUID,
+    p_tenant_id UUID,
+    p_user_message TEXT,
+    p_user_content_type VARCHAR DEFAULT 'text',
+    p_ai_response TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_user_message_id UUID;
+    v_ai_message_id UUID;
+    v_history_version BIGINT;
+BEGIN
+    INSERT INTO public.messages (conversation_id, tenant_id, sender_type, sender_name, content, content_type)
+    VALUES (p_conversation_id, p_tenant_id, 'customer', NULL, p_user_message, p_user_content_type)
+    RETURNING id INTO v_user_message_id;
+
+    INSERT INTO public.messages (conversation_id, tenant_id, sender_type, content, content_type)
+    VALUES (p_conversation_id, p_tenant_id, 'ai', p_ai_response, 'text')
+    RETURNING id INTO v_ai_message_id;
+
+    -- Denormalized counters: O(1) increments instead of COUNT(*) over messages
+    UPDATE public.conversations
+    SET message_count = COALESCE(message_count, 0) + 2,
+        ai_message_count = COALESCE(ai_message_count, 0) + 1,
+        last_message_at = NOW()
+    WHERE id = p_conversation_id
+    RETURNING history_version INTO v_history_version;
+
+    RETURN jsonb_build_object(
+        'user_message_id', v_user_message_id,
+        'ai_message_id', v_ai_message_id,
+        'history_version', v_history_version
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION save_turn TO service_role;
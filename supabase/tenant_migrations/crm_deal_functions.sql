@@ -0,0 +1,172 @@
+-- ============================================================================
+-- CRM DEAL FUNCTIONS - Server-side helpers for the backend DealManager
+-- Client Supabase (Tenant) - Run on each CLIENT's database after crm_engine_v2.sql
+-- ============================================================================
+
+-- ============================================================================
+-- 1. INDEXES
+-- ============================================================================
+
+-- Next cycle number per contact + pipeline (MAX over an index range)
+CREATE INDEX IF NOT EXISTS idx_crm_deals_contact_pipeline_cycle
+    ON crm_deals(contact_id, pipeline_id, cycle_number);
+
+-- Per-stage history lookups: stage duration and "been here before" checks
+CREATE INDEX IF NOT EXISTS idx_deal_history_deal_stage
+    ON crm_deal_history(deal_id, to_stage, created_at DESC);
+
+-- Pipeline board listing (pipeline + status, newest first). Covers the
+-- columns DealManager.get_deals_by_pipeline selects by default, so the
+-- listing is an index-only scan with no sort step
+CREATE INDEX IF NOT EXISTS idx_crm_deals_pipeline_board
+    ON crm_deals(pipeline_id, status, created_at DESC)
+    INCLUDE (id, contact_id, contact_name, current_stage_id, value, cycle_number);
+
+-- ============================================================================
+-- 2. STAGE ENTRY TIME
+-- When the deal entered its current stage, so stage durations need no
+-- history lookup. Kept current by a trigger, whichever client moves the deal.
+-- ============================================================================
+
+ALTER TABLE crm_deals ADD COLUMN IF NOT EXISTS stage_entered_at TIMESTAMPTZ;
+
+UPDATE crm_deals d
+SET stage_entered_at = COALESCE(
+    (
+        SELECT MAX(h.created_at) FROM crm_deal_history h
+        WHERE h.deal_id = d.id
+          AND h.to_stage = d.current_stage_id
+    ),
+    d.created_at
+)
+WHERE d.stage_entered_at IS NULL;
+
+ALTER TABLE crm_deals ALTER COLUMN stage_entered_at SET DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION set_stage_entered_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.current_stage_id IS DISTINCT FROM OLD.current_stage_id THEN
+        NEW.stage_entered_at = NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_crm_deals_stage_entered ON crm_deals;
+CREATE TRIGGER trigger_crm_deals_stage_entered
+    BEFORE UPDATE OF current_stage_id ON crm_deals
+    FOR EACH ROW EXECUTE FUNCTION set_stage_entered_at();
+
+-- ============================================================================
+-- 3. CREATE DEAL WITH CYCLE
+-- Inserts a deal with cycle_number = previous cycles for the contact in the
+-- pipeline + 1, in one round-trip. A transaction-scoped advisory lock per
+-- contact/pipeline keeps concurrent creates from taking the same number.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION create_deal_with_cycle(
+    p_contact_id UUID,
+    p_pipeline_id UUID,
+    p_stage_id VARCHAR,
+    p_contact_name VARCHAR DEFAULT NULL,
+    p_contact_phone VARCHAR DEFAULT NULL,
+    p_value DECIMAL DEFAULT 0,
+    p_metadata JSONB DEFAULT '{}'
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_deal crm_deals%ROWTYPE;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext(p_contact_id::TEXT || ':' || p_pipeline_id::TEXT));
+
+    INSERT INTO crm_deals (
+        contact_id, contact_name, contact_phone, pipeline_id,
+        current_stage_id, value, cycle_number, status, metadata
+    )
+    SELECT
+        p_contact_id, p_contact_name, p_contact_phone, p_pipeline_id,
+        p_stage_id, p_value, COALESCE(MAX(cycle_number), 0) + 1, 'open', p_metadata
+    FROM crm_deals
+    WHERE contact_id = p_contact_id
+      AND pipeline_id = p_pipeline_id
+    RETURNING * INTO v_deal;
+
+    RETURN to_jsonb(v_deal);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION create_deal_with_cycle TO service_role;
+
+-- ============================================================================
+-- 4. MOVE DEAL
+-- Moves a deal to a stage in one transaction: computes the time spent in the
+-- current stage, updates the deal, logs the history entry and returns the
+-- active pipeline_entry journeys for the target stage. Returns NULL when the
+-- deal does not exist; "moved" is false when it is already in the stage.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION move_deal_tx(
+    p_deal_id UUID,
+    p_target_stage VARCHAR,
+    p_triggered_by VARCHAR DEFAULT 'user',
+    p_triggered_by_id UUID DEFAULT NULL,
+    p_triggered_by_name VARCHAR DEFAULT NULL,
+    p_notes TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_deal crm_deals%ROWTYPE;
+    v_from_stage VARCHAR;
+    v_entered_at TIMESTAMPTZ;
+BEGIN
+    SELECT * INTO v_deal FROM crm_deals WHERE id = p_deal_id FOR UPDATE;
+    IF v_deal.id IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    v_from_stage := v_deal.current_stage_id;
+    IF v_from_stage = p_target_stage THEN
+        RETURN jsonb_build_object('deal', to_jsonb(v_deal), 'from_stage', v_from_stage, 'moved', false);
+    END IF;
+
+    v_entered_at := v_deal.stage_entered_at;
+
+    UPDATE crm_deals
+    SET current_stage_id = p_target_stage,
+        updated_at = NOW()
+    WHERE id = p_deal_id
+    RETURNING * INTO v_deal;
+
+    INSERT INTO crm_deal_history (
+        deal_id, from_stage, to_stage, duration_in_stage,
+        triggered_by, triggered_by_id, triggered_by_name, notes, metadata
+    )
+    VALUES (
+        p_deal_id, v_from_stage, p_target_stage,
+        COALESCE(EXTRACT(EPOCH FROM NOW() - v_entered_at)::INT, 0),
+        p_triggered_by, p_triggered_by_id, p_triggered_by_name, p_notes, '{}'
+    );
+
+    RETURN jsonb_build_object(
+        'deal', to_jsonb(v_deal),
+        'from_stage', v_from_stage,
+        'moved', true,
+        'journeys', COALESCE((
+            SELECT jsonb_agg(to_jsonb(j))
+            FROM automation_journeys j
+            WHERE j.trigger_type = 'pipeline_entry'
+              AND j.is_active = true
+              AND j.trigger_config->>'stage_id' = p_target_stage
+        ), '[]'::jsonb)
+    );
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION move_deal_tx TO service_role;